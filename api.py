@@ -1,37 +1,46 @@
 import sys
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from flask_restful import reqparse, abort, Api, Resource
-import colorama
-from colorama import Fore, Back, Style
-
+from beacons_server import backup
 from beacons_server import db
+from beacons_server import events
+from beacons_server import log
+from beacons_server import metrics
+from beacons_server import serialization
+from beacons_server import static
 from resources.bookmark import Bookmark
 from resources.box import Box
 from resources.column import Column
 from resources.row import Row
 from resources.slide import Slide
 from resources.beacons import Beacons
+from resources.changes import Changes
+from resources.search import Search
+from resources.tree import Tree
 from beacons_server import utils
 
-colorama.init(autoreset=True)
-
-app = Flask(
-    __name__,
-    static_folder = 'dist',
-    static_url_path = '',
-    template_folder = 'dist'
-)
-api = Api(app)
+# The frontend's files are served by beacons_server.static
+app = Flask(__name__, static_folder=None)
+app.config.from_envvar('BEACONS_SETTINGS', silent=True)
+api = Api(app, errors={
+    'DatabaseBusyError': {'message': 'The database is busy, please retry later', 'status': 503},
+})
+serialization.init_app(app, api)
+log.init_app(app)
+utils.init_app(app)
+static.init_app(app, 'dist')
+db.DB.COMMIT_LISTENERS.append(events.broker.publish)
+events.broker.max_subscribers = app.config.get('EVENTS_MAX_SUBSCRIBERS')
+
+# /metrics is not authenticated, and with several worker processes it only
+# holds the counters of the worker answering: it is opt-in
+app.config.setdefault('METRICS_ENABLED', False)
+metrics.registry.enabled = app.config['METRICS_ENABLED']
 
 CORS(app, resources={r'/*': {'origins': '*'}})
 
 
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-
 @app.route('/lastbookmarkslocations')
 def last_bookmarks_locations():
     db = utils.get_db()
@@ -47,22 +56,82 @@ def db_last_modification():
     return jsonify(utils.get_db_last_modification())
 
 
+@app.route('/beacons/events')
+def db_events():
+    """Stream a Server-Sent Event each time the data is modified."""
+    # Make sure the stream starts from the current data version, as it may
+    # have been modified by another process
+    events.broker.publish(utils.get_db().get_data_version()['data_version'])
+
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+    try:
+        stream = events.broker.subscribe(last_event_id)
+    except events.TooManySubscribers:
+        # Each stream holds one of the server's threads
+        response = jsonify(message='Too many clients follow the events, poll /beacons/changes instead')
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream, mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/export')
+def export():
+    """Stream a snapshot of every item as newline-delimited JSON, parents
+    before children (see beacons_server.backup)."""
+    snapshot = backup.Snapshot(utils.get_db())
+    lines = backup.export_lines(snapshot.db, serialization.get_backend())
+    headers = {'Content-Disposition': 'attachment; filename=beacons.ndjson'}
+    response = Response(serialization.buffered(lines), mimetype='application/x-ndjson', headers=headers)
+    response.call_on_close(snapshot.close)
+    return response
+
+
+def collect_metrics():
+    cache = Beacons.cache.stats()
+    return [
+        ('beacons_tree_cache_hits_total', 'counter', 'Number of trees served from the cache.', cache['hits']),
+        ('beacons_tree_cache_misses_total', 'counter', 'Number of trees built.', cache['misses']),
+        ('beacons_tree_cache_rebuild_seconds_total', 'counter', 'Time spent building trees.', cache['rebuild_time']),
+        ('beacons_tree_cache_size', 'gauge', 'Number of cached trees.', cache['size']),
+        ('beacons_events_subscribers', 'gauge', 'Number of Server-Sent Events subscribers.', events.broker.subscribers),
+    ]
+
+metrics.registry.add_collector(collect_metrics)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose the metrics in Prometheus' text format."""
+    if not metrics.registry.enabled:
+        abort(404)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 api.add_resource(Beacons, '/beacons', endpoint='beacons')
+api.add_resource(Changes, '/beacons/changes', endpoint='changes')
+api.add_resource(Search, '/search', endpoint='search')
 
 api.add_resource(Bookmark, '/bookmarks', endpoint='bookmarks')
 api.add_resource(Bookmark, '/bookmarks/<int:id>', endpoint='bookmark')
+api.add_resource(Tree, '/bookmarks/<int:id>/tree', endpoint='bookmark_tree', resource_class_kwargs={'table': 'bookmark'})
 
 api.add_resource(Box, '/boxes', endpoint='boxes')
 api.add_resource(Box, '/boxes/<int:id>', endpoint='box')
+api.add_resource(Tree, '/boxes/<int:id>/tree', endpoint='box_tree', resource_class_kwargs={'table': 'box'})
 
 api.add_resource(Column, '/columns', endpoint='columns')
 api.add_resource(Column, '/columns/<int:id>', endpoint='column')
+api.add_resource(Tree, '/columns/<int:id>/tree', endpoint='column_tree', resource_class_kwargs={'table': 'column'})
 
 api.add_resource(Row, '/rows', endpoint='rows')
 api.add_resource(Row, '/rows/<int:id>', endpoint='row')
+api.add_resource(Tree, '/rows/<int:id>/tree', endpoint='row_tree', resource_class_kwargs={'table': 'row'})
 
 api.add_resource(Slide, '/slides', endpoint='slides')
 api.add_resource(Slide, '/slides/<int:id>', endpoint='slide')
+api.add_resource(Tree, '/slides/<int:id>/tree', endpoint='slide_tree', resource_class_kwargs={'table': 'slide'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Back up, export and import the items of a database.
+
+- backup() copies a database being served with SQLite's online backup API,
+  the copy being a consistent snapshot.
+- export_lines() serializes the items as newline-delimited JSON, one item
+  per line holding its 'type' (table) along with its fields. Every slide
+  comes first, then every row, and so on: parents always come before their
+  children. Items are streamed from a cursor, in constant memory.
+- import_lines() rebuilds a database from these lines, within a single
+  transaction. Items keep their ids. The server must be stopped before
+  importing into the database it serves.
+
+Usage: python -m beacons_server.backup backup <target> [--db beacons.sqlite]
+       python -m beacons_server.backup export [file] [--db beacons.sqlite]
+       python -m beacons_server.backup import <file> <target>
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from beacons_server import serialization
+from beacons_server.db import DB, DatabaseBusyError, remove_database, replace_database
+from beacons_server.rows import FIELDS
+
+# Number of items inserted by each request of an import
+CHUNK_SIZE = 10000
+
+
+def backup(db, path):
+    """Copy the database of the 'db' handle to 'path', replacing it. The
+    whole copy is made while holding a single read lock, which does not
+    block the writers of a database in WAL mode."""
+    target = sqlite3.connect(path)
+    try:
+        db.conn.backup(target)
+    finally:
+        target.close()
+
+
+class Snapshot:
+    """Backup of a database in a temporary file, removed on close."""
+
+    def __init__(self, db):
+        fd, self.path = tempfile.mkstemp(prefix='beacons-', suffix='.sqlite')
+        os.close(fd)
+        try:
+            backup(db, self.path)
+            self.db = DB(self.path, silent=True)
+        except BaseException:
+            os.remove(self.path)
+            raise
+
+
+    def close(self):
+        self.db.close()
+        os.remove(self.path)
+
+
+def export_lines(db, backend = None):
+    """Yield the items of the database as lines of JSON, in bytes, parents
+    before children. The database should not be modified meanwhile: export
+    a Snapshot of a database being served."""
+    backend = backend or serialization.BACKENDS[serialization.DEFAULT_BACKEND]
+    for table in DB.OBJ_TYPES:
+        fields = FIELDS[table]
+        cur = db.execute_sql('SELECT %s FROM %s ORDER BY id' % (', '.join(fields), table))
+        if cur is None:
+            raise sqlite3.DatabaseError('Could not read the %s table' % table)
+        for row in cur:
+            item = {'type': table}
+            item.update(zip(fields, row))
+            line = backend.dumps(item)
+            if isinstance(line, str):
+                line = line.encode()
+            yield line + b'\n'
+
+
+def import_lines(db, lines, backend = None, chunk_size = None):
+    """Insert the items of exported lines into the database, within a
+    single transaction. Return the number of items inserted. Raise
+    ValueError, the transaction being rolled back, if a line is invalid or
+    cannot be inserted."""
+    backend = backend or serialization.BACKENDS[serialization.DEFAULT_BACKEND]
+    chunk_size = chunk_size or CHUNK_SIZE
+    table, chunk, count = None, [], 0
+
+    def insert(table, chunk):
+        fields = FIELDS[table]
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(fields), ', '.join('?' * len(fields)))
+        if db.execute_sql(sql, chunk, many=True) is None:
+            raise ValueError('Could not insert the %s items' % table)
+
+    with db.transaction():
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                item = backend.loads(line)
+                fields = FIELDS[item['type']]
+            except (ValueError, TypeError, KeyError):
+                raise ValueError('Line %d is not an exported item' % number)
+
+            if item['type'] != table or len(chunk) >= chunk_size:
+                if len(chunk) > 0:
+                    insert(table, chunk)
+                table, chunk = item['type'], []
+            chunk.append(tuple(item.get(field) for field in fields))
+            count += 1
+
+        if len(chunk) > 0:
+            insert(table, chunk)
+    return count
+
+
+def import_file(source, target, backend = None):
+    """Build the database 'target' from an export file, which is read from
+    stdin if 'source' is '-'. The database is built in a temporary file,
+    then swapped in place of 'target'. Return the number of items. Raise
+    DatabaseBusyError if 'target' is used by another connection (see
+    replace_database)."""
+    temporary = target + '.importing'
+    remove_database(temporary)
+    db = DB(temporary, create_tables=True, silent=True)
+    try:
+        if source == '-':
+            count = import_lines(db, sys.stdin.buffer, backend)
+        else:
+            with open(source, 'rb') as file:
+                count = import_lines(db, file, backend)
+    except BaseException:
+        db.close()
+        remove_database(temporary)
+        raise
+    db.close()
+
+    try:
+        replace_database(temporary, target)
+    except BaseException:
+        remove_database(temporary)
+        raise
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup_parser = subparsers.add_parser('backup', help='copy the database, while it is being served')
+    backup_parser.add_argument('target')
+    backup_parser.add_argument('--db', default='beacons.sqlite')
+
+    export_parser = subparsers.add_parser('export', help='export the items of a snapshot as JSON lines')
+    export_parser.add_argument('file', nargs='?', default='-', help="output file, '-' for stdout (default)")
+    export_parser.add_argument('--db', default='beacons.sqlite')
+
+    import_parser = subparsers.add_parser('import', help='build a new database from exported items, '
+                                          'the server using it must be stopped')
+    import_parser.add_argument('file', help="exported items, '-' for stdin")
+    import_parser.add_argument('target', help='database to create, replaced if it exists')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        try:
+            count = import_file(args.file, args.target)
+        except (ValueError, DatabaseBusyError) as e:
+            sys.exit(str(e))
+        print('%d items imported into %s' % (count, args.target), file=sys.stderr)
+        sys.exit()
+
+    if not os.path.isfile(args.db):
+        sys.exit("The database '%s' does not exist" % args.db)
+    db = DB(args.db, silent=True)
+    if args.command == 'backup':
+        backup(db, args.target)
+    else:
+        snapshot = Snapshot(db)
+        try:
+            output = sys.stdout.buffer if args.file == '-' else open(args.file, 'wb')
+            with output:
+                output.writelines(serialization.buffered(export_lines(snapshot.db)))
+        finally:
+            snapshot.close()
+    db.close()
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TreeCache:
+    """Memoize assembled beacons trees by key. Once 'maxsize' entries are
+    stored, the least recently used one is evicted.
+    Values are shared between callers and must not be modified.
+    Values may be tied to the version of the data they were built from: once
+    a newer version is seen, the entries of the older ones are dropped, as
+    they can never be hit again."""
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented on each invalidation so that a tree built from data
+        # read before a write is not stored after that write
+        self._generation = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.rebuild_time = 0.0
+
+
+    def get(self, key, build, version = None):
+        """Return the cached value for 'key', calling 'build()' to compute
+        and store it if it is not cached yet. A value built for a 'version'
+        older than the last one seen is not stored."""
+        with self._lock:
+            if version is not None and (self._version is None or version > self._version):
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        start = time.perf_counter()
+        value = build()
+        duration = time.perf_counter() - start
+
+        with self._lock:
+            self.rebuild_time += duration
+            if generation == self._generation and (version is None or version == self._version):
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+
+    def clear(self):
+        """Invalidate every cached value."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+
+    def stats(self):
+        """Return the cache's counters as a dictionnary. 'rebuild_time' is
+        the total time spent building values, in seconds."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'rebuild_time': self.rebuild_time,
+            }
@@ -0,0 +1,47 @@
+import functools
+import time
+from flask import request, Response
+from flask_restful.utils import unpack
+from werkzeug.http import http_date
+from beacons_server import utils
+
+def conditional(method):
+    """Decorate a resource's GET handler so that its responses carry the
+    database's data version as a strong ETag along with a Last-Modified
+    header. Requests whose If-None-Match (or, lacking it, If-Modified-Since)
+    header matches the current data get a 304 Not Modified response.
+
+    Last-Modified only has a one second precision: while the last write
+    happened during the current second, another write could follow within
+    the same second. Last-Modified is then neither sent nor checked."""
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        # The version is read before the data so that a concurrent write
+        # can only make the ETag older than the data, never newer
+        version = utils.get_data_version()
+        last_modification = version['last_modification']
+        if int(last_modification) >= int(time.time()):
+            last_modification = None
+
+        headers = {'ETag': '"%s"' % version['data_version']}
+        if last_modification is not None:
+            headers['Last-Modified'] = http_date(last_modification)
+
+        if is_not_modified(str(version['data_version']), last_modification):
+            return Response(status=304, headers=headers)
+
+        data, code, method_headers = unpack(method(*args, **kwargs))
+        return data, code, {**headers, **method_headers}
+
+    return wrapper
+
+
+def is_not_modified(etag, last_modification):
+    """Return whether the current request's validators match the given
+    ETag and last modification timestamp, which is ignored if None."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since is not None and last_modification is not None:
+        return int(last_modification) <= request.if_modified_since.timestamp()
+    return False
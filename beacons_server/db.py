@@ -1,19 +1,152 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import functools
+import json
+import logging
+import os
+import random
+import re
 import sqlite3
-import colorama
-from colorama import Fore, Back, Style
+import threading
+import time
+from contextlib import contextmanager
+from beacons_server import metrics
+from beacons_server import rows
+
+logger = logging.getLogger(__name__)
+sql_logger = logging.getLogger('beacons_server.sql')
+slow_query_logger = logging.getLogger('beacons_server.sql.slow')
+
+# Current time as a floating UNIX timestamp
+UNIX_TIME_SQL = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """Raised when a write transaction could not be started because the
+    database stayed locked by other writers."""
+
+
+class SchemaUpgradeError(sqlite3.DatabaseError):
+    """Raised when a schema upgrade failed, the database being left at its
+    previous version."""
+
+
+def search_index_sql(obj_types, fields):
+    """Return the statements creating the full-text search index of the
+    items, 'fields' holding the indexed fields of each table, and the
+    triggers keeping it in sync with the tables.
+    An item's row in the index is id * 8 + its table's index in obj_types."""
+    statements = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+            name, url,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );""",
+    ]
+    for table, table_fields in fields.items():
+        rowid = '%%s.id * 8 + %d' % obj_types.index(table)
+        values = lambda row: ', '.join('%s.%s' % (row, field) if field in table_fields else 'NULL' for field in ('name', 'url'))
+        statements += [
+            """CREATE TRIGGER IF NOT EXISTS %s_search_insert AFTER INSERT ON %s BEGIN
+                INSERT INTO search (rowid, name, url) VALUES (%s, %s);
+            END;""" % (table, table, rowid % 'new', values('new')),
+            """CREATE TRIGGER IF NOT EXISTS %s_search_update AFTER UPDATE OF %s ON %s BEGIN
+                INSERT OR REPLACE INTO search (rowid, name, url) VALUES (%s, %s);
+            END;""" % (table, ', '.join(table_fields), table, rowid % 'new', values('new')),
+            """CREATE TRIGGER IF NOT EXISTS %s_search_delete AFTER DELETE ON %s BEGIN
+                DELETE FROM search WHERE rowid = %s;
+            END;""" % (table, table, rowid % 'old'),
+            'INSERT OR REPLACE INTO search (rowid, name, url) SELECT %s, %s FROM %s;' % (rowid % table, values(table), table),
+        ]
+    return statements
+
+
+# Files SQLite may keep next to a database
+JOURNAL_SUFFIXES = ['-wal', '-shm', '-journal']
+
+
+def remove_database(path):
+    """Remove a database file along with its journal files, if any."""
+    for suffix in JOURNAL_SUFFIXES + ['']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def replace_database(source, target):
+    """Replace the 'target' database file with 'source', which must be
+    closed, atomically. The journal files of 'target' are removed first,
+    as they would otherwise be applied to the new database.
+
+    Raise DatabaseBusyError if 'target' is open by another connection: its
+    writes which were not checkpointed yet would be lost, and it would keep
+    writing to the replaced file. Connections to a database in WAL mode are
+    detected once they have read it, as those of a server are, but idle
+    connections to a database in rollback journal mode are not: stop the
+    server first.
+    The data version of 'source' is set above the one of 'target', so that
+    the ETags given for 'target' are not valid for 'source'."""
+    data_version = None
+    if os.path.exists(target):
+        conn = sqlite3.connect(target, timeout=0, isolation_level=None)
+        try:
+            # Refused while another connection holds the database
+            conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+            conn.execute('BEGIN EXCLUSIVE')
+            row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+            data_version = row[0] if row is not None else None
+            conn.execute('ROLLBACK')
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                raise DatabaseBusyError("The database '%s' is used by another connection" % target) from e
+            if 'no such table' not in str(e):
+                raise
+        finally:
+            conn.close()
+
+    if data_version is not None:
+        conn = sqlite3.connect(source, isolation_level=None)
+        try:
+            conn.execute("UPDATE meta SET value = MAX(value, ?) + 1 WHERE key = 'data_version'", (data_version,))
+        finally:
+            conn.close()
+
+    for suffix in JOURNAL_SUFFIXES:
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(source, target)
+
+
+# Write locks of the databases, indexed by path, serializing the writers of
+# a process so that they wait for each other instead of for SQLite's locks
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+def get_write_lock(path):
+    if path != ':memory:':
+        path = os.path.abspath(path)
+    with _write_locks_guard:
+        return _write_locks.setdefault(path, threading.RLock())
 
-colorama.init(autoreset=True)
 
 class DB:
 
     SQL_COMMANDS_ORDER = ['GROUP BY', 'ORDER BY', 'ASC', 'DESC', 'LIMIT']
     SQL_COMMANDS_WITHOUT_ARGUMENT = ['ASC', 'DESC']
+    # Values accepted by the '_order_by' and '_group_by' commands, which are
+    # put as is in the requests
+    SQL_COLUMNS_REGEX = re.compile(r'^\s*\w+(\s+(ASC|DESC))?(\s*,\s*\w+(\s+(ASC|DESC))?)*\s*$', re.IGNORECASE)
 
     # Describe the structure of the data base objects
     OBJ_TYPES = ['slide', 'row', 'column', 'box', 'bookmark']
+
+    # Fields of the items indexed for full-text search
+    SEARCH_FIELDS = {
+        'row': ('name',),
+        'column': ('name',),
+        'box': ('name',),
+        'bookmark': ('name', 'url'),
+    }
     SQL_TABLES = {
         'slide': """CREATE TABLE IF NOT EXISTS slide (
             id integer PRIMARY KEY,
@@ -57,24 +190,109 @@ class DB:
         );""",
     }
 
-
-    def __init__(self, db_path, create_tables=False, silent=False):
-        """Initialize the connection with the SQLite data base file."""
+    # Schema upgrades, applied in order on databases whose 'user_version' is
+    # lower than SCHEMA_VERSION. The item at index i upgrades the schema from
+    # version i to version i+1.
+    SCHEMA_UPGRADES = [
+        # 1: index children lookups and ordering by position
+        [
+            'CREATE INDEX IF NOT EXISTS slide_position ON slide (position);',
+            'CREATE INDEX IF NOT EXISTS row_parent_position ON row (parent_id, position);',
+            'CREATE INDEX IF NOT EXISTS column_parent_position ON column (parent_id, position);',
+            'CREATE INDEX IF NOT EXISTS box_parent_position ON box (parent_id, position);',
+            'CREATE INDEX IF NOT EXISTS bookmark_parent_position ON bookmark (parent_id, position);',
+        ],
+        # 2: data version, incremented by every committed write
+        [
+            'CREATE TABLE IF NOT EXISTS meta (key text PRIMARY KEY, value);',
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0);",
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('last_modification', %s);" % UNIX_TIME_SQL,
+        ],
+        # 3: log of the changes made to the items
+        [
+            """CREATE TABLE IF NOT EXISTS change_log (
+                seq integer PRIMARY KEY AUTOINCREMENT,
+                operation text,
+                table_name text,
+                item_id integer,
+                data text
+            );""",
+        ],
+        # 4: full-text search index of the items' names and urls
+        search_index_sql(OBJ_TYPES, SEARCH_FIELDS),
+    ]
+    SCHEMA_VERSION = len(SCHEMA_UPGRADES)
+
+    # Number of entries kept in the change log
+    CHANGE_LOG_SIZE = 1000
+
+    # Callables called with the new data version after each committed write
+    COMMIT_LISTENERS = []
+
+    # Requests lasting longer than this duration, in seconds, are logged to
+    # the 'beacons_server.sql.slow' logger. None disables their timing.
+    SLOW_QUERY_THRESHOLD = None
+
+    # Number of SQL requests whose text, and compiled statement on SQLite's
+    # side, are kept in cache
+    STATEMENT_CACHE_SIZE = 256
+
+    # Time, in seconds, SQLite waits for a lock held by another connection
+    # before failing with 'database is locked'
+    BUSY_TIMEOUT = 1.0
+
+    # Number of times a write transaction which could not be started
+    # because the database is locked is retried, and the delay before the
+    # first retry, in seconds. The delay doubles with each retry.
+    BUSY_RETRIES = 4
+    BUSY_BACKOFF = 0.05
+
+
+    def __init__(self, db_path, create_tables=False, silent=False, pragmas=None):
+        """Initialize the connection with the SQLite data base file.
+        'pragmas' is an optional dictionnary of PRAGMA statements to apply
+        to the connection, e.g. {'journal_mode': 'WAL'}."""
+        self.db_path = db_path
         self.conn = self._create_connection(db_path)
         self.SILENT = silent
+        self._write_lock = get_write_lock(db_path)
+        self._transaction_depth = 0
+        self._transaction_failed = False
+        self._transaction_error = None
+        self._total_changes = self.conn.total_changes
+        if pragmas is not None:
+            self.set_pragmas(pragmas)
         if create_tables:
             self.create_tables()
 
 
     def __del__(self):
         """End the SQLite data base connection."""
-        self.conn.close()
+        self.close()
+
+
+    def close(self):
+        """Close the SQLite data base connection, if not already closed."""
+        conn = getattr(self, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.conn = None
 
 
     def _create_connection(self, path):
-        """Create a database connection to a SQLite database."""
+        """Create a database connection to a SQLite database.
+        The connection is not bound to the thread creating it so that it
+        can be reused by a connection pool across requests. It is in
+        autocommit mode, transactions being started explicitly by
+        transaction()."""
         try:
-            conn = sqlite3.connect(path)
+            conn = sqlite3.connect(
+                path,
+                timeout=self.BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.STATEMENT_CACHE_SIZE
+            )
             conn.row_factory = sqlite3.Row
             conn.text_factory = str
             return conn
@@ -84,65 +302,350 @@ class DB:
         return None
 
 
-    def execute_sql(self, sql, data = None):
-        """Execute an SQL request along with data, if any."""
+    def set_pragmas(self, pragmas):
+        """Apply the given PRAGMA statements to the connection."""
+        for name, value in pragmas.items():
+            self.conn.execute('PRAGMA %s = %s' % (name, value))
+
+
+    def execute_sql(self, sql, data = None, many = False):
+        """Execute an SQL request along with data, if any. If 'many' is True,
+        the request is executed once for each tuple of the 'data' list.
+        Requests which may write are executed within their own transaction
+        unless they are executed inside a transaction block.
+        Return None if the request fails."""
+        if self._transaction_depth == 0 and not self._is_read_only(sql):
+            with self.transaction(raise_errors=False):
+                return self.execute_sql(sql, data, many)
+
+        if not self.SILENT and sql_logger.isEnabledFor(logging.DEBUG):
+            if many:
+                sql_logger.debug('%s -- %d rows', sql, len(data))
+            else:
+                sql_logger.debug('%s -- %s', sql, data)
+
+        threshold = self.SLOW_QUERY_THRESHOLD
+        timed = threshold is not None or metrics.registry.enabled
+        if timed:
+            start = time.perf_counter()
+
         try:
-            if not self.SILENT:
-                print('   * %s: %s' % (Fore.CYAN + 'sql' + Style.RESET_ALL, sql))
             cur = self.conn.cursor()
             if data is None:
                 cur.execute(sql)
+            elif many:
+                cur.executemany(sql, data)
             else:
-                if not self.SILENT:
-                    print('   * %s: %s' % (Fore.CYAN + 'data' + Style.RESET_ALL, str(data)))
                 cur.execute(sql, data)
+        except sqlite3.Error as e:
+            if self._transaction_depth > 0:
+                self._transaction_failed = True
+                if self._transaction_error is None:
+                    self._transaction_error = e
+            logger.error('%s -- %s', e, sql)
+            if metrics.registry.enabled:
+                metrics.record_sql_error(sql)
+            return None
+
+        if timed:
+            duration = time.perf_counter() - start
+            if metrics.registry.enabled:
+                metrics.record_sql(sql, duration, cur.rowcount)
+            if threshold is not None and duration >= threshold:
+                slow_query_logger.warning('%.1f ms: %s -- %s', duration * 1000, sql, len(data) if many else data)
+        return cur
+
+
+    @staticmethod
+    def _is_read_only(sql):
+        """Return whether an SQL request only reads data."""
+        start = sql.lstrip()[:6].upper()
+        return start == 'SELECT' or (start == 'PRAGMA' and '=' not in sql)
+
+
+    @contextmanager
+    def transaction(self, raise_errors = True):
+        """Execute the SQL requests of the block inside a single transaction.
+        The commit is deferred to the end of the block and every request is
+        rolled back if one of them fails or if an exception is raised.
+        Transactions can be nested, only the outermost one commits.
+
+        If a request failed, the outermost block raises its sqlite3.Error
+        once the transaction is rolled back, so that the writes of the block
+        are not reported as successful. Methods reporting the failure of
+        their own transaction by returning None set 'raise_errors' to False.
+
+        The outermost block takes the database's write lock, shared by the
+        handles of this process, then starts the transaction with BEGIN
+        IMMEDIATE, so that what the block reads cannot be modified by
+        another writer before it commits. DatabaseBusyError is raised if
+        the database stays locked."""
+        if self._transaction_depth == 0:
+            self._begin()
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_failed = True
+            self._end_transaction(raise_errors=False)
+            raise
+        self._end_transaction(raise_errors)
+
+
+    def _end_transaction(self, raise_errors):
+        """Leave a transaction block. The outermost one commits, or rolls
+        back if a request failed, then raises the error of that request if
+        'raise_errors' is True."""
+        self._transaction_depth -= 1
+        if self._transaction_depth > 0:
+            return
+
+        failed, error = self._transaction_failed, self._transaction_error
+        self._transaction_failed, self._transaction_error = False, None
+        try:
+            if failed:
+                self.rollback()
+            else:
+                self._commit()
+        finally:
+            self._write_lock.release()
+        if error is not None and raise_errors:
+            raise error
+
+
+    def _begin(self):
+        """Take the write lock and start a write transaction, retrying with
+        an exponential backoff while the database is locked by another
+        process."""
+        if not self._write_lock.acquire(timeout=self.BUSY_TIMEOUT * (self.BUSY_RETRIES + 1)):
+            raise DatabaseBusyError('Timed out waiting for the write lock')
+
+        delay = self.BUSY_BACKOFF
+        for attempt in range(self.BUSY_RETRIES + 1):
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    self._write_lock.release()
+                    raise
+                if attempt == self.BUSY_RETRIES:
+                    self._write_lock.release()
+                    logger.error('Could not start a transaction: %s', e)
+                    raise DatabaseBusyError(str(e)) from e
+                logger.warning('Database is locked, retrying in %.0f ms', delay * 1000)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay *= 2
+
+
+    def _commit(self):
+        """Commit the current transaction. On failure, it is rolled back
+        and the error is raised again, so that the block's writes are not
+        reported as successful.
+        If data was modified, the data version is incremented within the
+        same transaction."""
+        try:
+            changed = self.conn.total_changes != self._total_changes
+            if changed:
+                self._increment_data_version()
+                self._compact_change_log()
             self.conn.commit()
-            return cur
+            self._total_changes = self.conn.total_changes
         except sqlite3.Error as e:
-            print(e)
+            self.rollback()
+            logger.error('Commit failed: %s', e)
+            raise
+
+        if changed and len(self.COMMIT_LISTENERS) > 0:
+            self._notify_commit()
+
+
+    def _notify_commit(self):
+        """Call the commit listeners with the current data version."""
+        version = self.get_data_version().get('data_version')
+        if version is None:
+            return
+        for listener in self.COMMIT_LISTENERS:
+            try:
+                listener(version)
+            except Exception:
+                logger.exception('Commit listener %r failed', listener)
+
+
+    def rollback(self):
+        """Roll back the current transaction."""
+        self.conn.rollback()
+        self._total_changes = self.conn.total_changes
+
+
+    def _increment_data_version(self):
+        sql = """UPDATE meta SET value = CASE key
+            WHEN 'data_version' THEN value + 1
+            ELSE %s END
+            WHERE key IN ('data_version', 'last_modification')""" % UNIX_TIME_SQL
+        self._execute_bookkeeping(sql)
+
+
+    def _execute_bookkeeping(self, sql, data = (), many = False):
+        """Execute a request on a bookkeeping table (meta, change_log),
+        ignoring it if the table does not exist because the schema was not
+        upgraded yet."""
+        try:
+            if many:
+                self.conn.executemany(sql, data)
+            else:
+                self.conn.execute(sql, data)
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+
+
+    def get_data_version(self):
+        """Return a dictionnary holding the 'data_version' counter, which is
+        incremented by every committed write, and the 'last_modification'
+        UNIX timestamp of that write."""
+        rows = self.select_sql("SELECT key, value FROM meta WHERE key IN ('data_version', 'last_modification')")
+        return {row['key']: row['value'] for row in rows}
 
 
     def create_tables(self):
-        """Create default tables."""
+        """Create default tables, then upgrade the schema to its latest
+        version."""
         if not self.SILENT:
-            print('Create tables...')
+            logger.info('Create tables...')
         for name in self.SQL_TABLES.keys():
             self.execute_sql(self.SQL_TABLES[name])
+        self.upgrade_schema()
+
+
+    def get_schema_version(self):
+        """Return the schema version stored in the database's user_version."""
+        return self.select_sql('PRAGMA user_version', unique=True)['user_version']
+
+
+    def upgrade_schema(self):
+        """Apply the schema upgrades the database is missing, if any.
+        Return the resulting schema version. Raise SchemaUpgradeError if a
+        statement fails, every upgrade being rolled back."""
+        version = self.get_schema_version()
+        if version >= self.SCHEMA_VERSION:
+            return version
+
+        with self.transaction():
+            # Read again once the write lock is held, as another process may
+            # have upgraded the schema meanwhile
+            version = self.get_schema_version()
+            if version >= self.SCHEMA_VERSION:
+                return version
+
+            for upgrade in self.SCHEMA_UPGRADES[version:]:
+                if not self.SILENT:
+                    logger.info('Upgrade schema to version %d...', version + 1)
+                for sql in upgrade:
+                    if self.execute_sql(sql) is None:
+                        raise SchemaUpgradeError('Could not upgrade the schema to version %d' % (version + 1))
+                version += 1
+            if self.execute_sql('PRAGMA user_version = %d' % version) is None:
+                raise SchemaUpgradeError('Could not store the schema version %d' % version)
+
+        return version
 
 
     def insert_object(self, table, obj):
         """Insert an object represented as a dictionnary inside a table.
-        Return the id of the row created."""
+        Return the id of the row created.
+        If the object's 'position' is None, it is set to the position
+        following its last sibling within the INSERT request itself, so that
+        concurrent insertions cannot get the same position."""
         if len(list(obj.values())) == 0:
             sql = 'INSERT INTO %s DEFAULT VALUES' % table
-            values = ()
+            data = ()
+            generate_position = False
         else:
             # Ignore SQL commands
             obj = {k:v for k,v in obj.items() if k[0] != '_'}
 
-            fields = '(%s)' % ','.join(obj.keys())
+            fields = tuple(obj.keys())
+            data = list(obj.values())
 
-            values = ['?' for i in range(len(obj.keys()))]
-            values = '(%s)' % ','.join(values)
+            # Generate 'position' attribute if not set
+            generate_position = 'position' in obj and obj['position'] is None
+            if generate_position:
+                index = fields.index('position')
+                data[index:index + 1] = [obj['parent_id']] * 2 if 'parent_id' in obj else []
 
-            sql = 'INSERT INTO %s %s VALUES %s' % (table, fields, values)
+            sql = self._insert_statement(table, fields, generate_position)
 
-        # Generate 'position' attribute if not set
-        if 'position' in obj and obj['position'] is None:
-            if 'parent_id' in obj and obj['parent_id'] != None:
-                position = len(self.select(table, parent_id=obj['parent_id']))
-            else:
-                position = len(self.select(table))
-            obj['position'] = position
-
-        data = tuple(obj.values())
+        with self.transaction(raise_errors=False):
+            cur = self.execute_sql(sql, tuple(data))
+            if cur != None:
+                if generate_position:
+                    row = self.select_sql('SELECT position FROM %s WHERE id = ?' % table, (cur.lastrowid,), unique=True)
+                    obj['position'] = row['position']
+                self._record_change('insert', table, cur.lastrowid, obj)
 
-        cur = self.execute_sql(sql, data)
         if cur != None:
             return cur.lastrowid
         return None
 
 
+    def insert_objects(self, table, objs):
+        """Insert a list of objects represented as dictionnaries having the
+        same keys inside a table, within a single transaction. Positions
+        which are None are generated as in insert_object, following the
+        list's order.
+        Return the ids of the rows created, or None on failure."""
+        if len(objs) == 0:
+            return []
+
+        # Ignore SQL commands
+        objs = [{k:v for k,v in obj.items() if k[0] != '_'} for obj in objs]
+        fields = list(objs[0].keys())
+
+        values = ['?' for field in fields]
+        if 'position' in fields:
+            index = fields.index('position')
+            values[index] = 'COALESCE(?, %s)' % self._next_position_sql(table, 'parent_id' in fields)
+
+        def get_data(obj):
+            for field in fields:
+                yield obj[field]
+                if field == 'position' and 'parent_id' in fields:
+                    yield obj['parent_id']
+                    yield obj['parent_id']
+
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ','.join(fields), ','.join(values))
+        data = [tuple(get_data(obj)) for obj in objs]
+
+        with self.transaction(raise_errors=False):
+            if self.execute_sql(sql, data, many=True) is None:
+                return None
+
+            # Rows inserted by a single request within a transaction get
+            # consecutive ids
+            last_id = self.select_sql('SELECT last_insert_rowid() AS id', unique=True)['id']
+            ids = list(range(last_id - len(objs) + 1, last_id + 1))
+
+            rows = self.select_ids(table, ids)
+            self._record_changes('insert', table, [(row['id'], {field: row[field] for field in fields}) for row in rows])
+
+        return ids
+
+
+    @staticmethod
+    def _next_position_sql(table, has_parent):
+        """Return a sub-query computing the position following the last item
+        of the table, or, if 'has_parent' is True, following the last item
+        having the parent given twice as its parameters. Items whose parent
+        is None follow the last item of the table, as when they have no
+        'parent_id' field."""
+        next_position = '(SELECT COALESCE(MAX(position) + 1, 0) FROM %s)' % table
+        if not has_parent:
+            return next_position
+        next_sibling_position = '(SELECT COALESCE(MAX(position) + 1, 0) FROM %s WHERE parent_id = ?)' % table
+        return '(CASE WHEN ? IS NULL THEN %s ELSE %s END)' % (next_position, next_sibling_position)
+
+
     def select_sql(self, sql, obj=None, unique=False):
         """Execute an SQL request and return the objects selected as a list of
         dictionnaries. Return an empty list if no object where found.
@@ -153,6 +656,8 @@ class DB:
                 return None
             return []
         res = [dict(row) for row in cur.fetchall()]
+        if metrics.registry.enabled:
+            metrics.record_rows(sql, len(res))
         if unique:
             if len(res) > 0:
                 return res[0]
@@ -162,44 +667,138 @@ class DB:
 
     def select(self, table, orderBy='', unique=False, args = {}, **kwargs):
         """Apply a SELECT request on a table. It can specify an AND
-        condition using named arguments and an ORDER BY.
+        condition using named arguments and an ORDER BY, 'orderBy' being
+        used unless an '_order_by' argument is given.
         If 'unique' is True, return the object itself if it exists or None."""
-        where_args, sql_args = self._get_sql_args(args, **kwargs)
-
-        where = self._format_and_condition(*where_args.keys())
-        sql_commands = self._format_sql_args(sql_args)
-
-        sql = "SELECT * FROM %s %s %s" % (table, where, sql_commands)
-        data = tuple(where_args.values())
-
-        return self.select_sql(sql, data, unique)
-
-
-    def _get_sql_args(self, args = {}, **kwargs):
-        """Return received arguments splitted into two sets representing WHERE
-        arguments and SQL commands arguments. Sets are made according to the
-        arguments keys :
-        - SQL arguments' key starts with a '_' ; key is set in uppercase ;
-        - Every other argument goes inside the WHERE set.
-        Arguments with None values are ignored.
-        """
-        # Merge the two sets of args
-        args = {**args, **kwargs}
-        # Remove arguments' None values
-        args = {k:v for k,v in args.items() if v is not None}
-
-        # Get the SQL request's arguments
-        sql_keys = [k for k in args.keys() if k[0] == '_']
-        sql_args = {k:v for k,v in args.items() if k in sql_keys}
+        where_fields, data, sql_commands = [], [], []
+        # Split the WHERE arguments from the SQL commands, starting with '_'
+        for key, value in {**args, **kwargs}.items():
+            if value is None:
+                continue
+            if key[0] == '_':
+                sql_commands.append((key, tuple(value) if isinstance(value, list) else value))
+            else:
+                where_fields.append(key)
+                data.append(value)
+
+        if orderBy and all(key != '_order_by' for key, value in sql_commands):
+            sql_commands.append(('_order_by', orderBy))
+
+        sql = self._select_statement(table, tuple(where_fields), tuple(sql_commands))
+        return self.select_sql(sql, tuple(data), unique)
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _select_statement(table, where_fields, sql_commands):
+        """Return the text of a SELECT request on a table with an AND
+        condition on the given fields, followed by the given SQL commands
+        as (key, value) tuples. Results are cached.
+        Raise ValueError if an '_order_by' or '_group_by' command is not a
+        list of columns."""
+        for key, value in sql_commands:
+            if key not in ('_order_by', '_group_by'):
+                continue
+            columns = ', '.join(value) if isinstance(value, tuple) else str(value)
+            if not DB.SQL_COLUMNS_REGEX.match(columns):
+                raise ValueError('Invalid %s: %r' % (key[1:].replace('_', ' '), value))
+        where = DB._format_and_condition(*where_fields)
+        sql_commands = DB._format_sql_args(dict(sql_commands))
+        return "SELECT * FROM %s %s %s" % (table, where, sql_commands)
+
+
+    def select_page(self, table, after = None, limit = None, fields = None, args = {}, **kwargs):
+        """Select a page of the items of a table, ordered by id: at most
+        'limit' items whose id is greater than 'after'. Items can be
+        filtered with an AND condition as in select(), and hold only the
+        given 'fields' along with their id.
+        Return the items and the id after which the next page starts, or
+        None if there are no more items."""
+        where_fields, data = [], []
+        for key, value in {**args, **kwargs}.items():
+            if value is not None and key[0] != '_':
+                where_fields.append(key)
+                data.append(value)
+        if after is not None:
+            data.append(after)
+        if limit is not None:
+            # Select one more item to know whether there is a next page
+            data.append(limit + 1)
+
+        fields = tuple(fields) if fields is not None else None
+        sql = self._page_statement(table, tuple(where_fields), after is not None, limit is not None, fields)
+        items = self.select_sql(sql, tuple(data))
+
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            return items, items[-1]['id']
+        return items, None
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _page_statement(table, where_fields, after, limit, fields):
+        """Return the text of the SELECT request of select_page(). Results
+        are cached."""
+        conditions = ['%s = ?' % field for field in where_fields]
+        if after:
+            conditions.append('id > ?')
+        where = 'WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+        columns = ', '.join(['id'] + [field for field in fields if field != 'id']) if fields is not None else '*'
+        return 'SELECT %s FROM %s %s ORDER BY id %s' % (columns, table, where, 'LIMIT ?' if limit else '')
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _update_statement(table, fields):
+        """Return the text of an UPDATE request setting the given fields of
+        the item having a given id. Results are cached."""
+        fields_values = ', '.join(DB._format_fields_values(*fields))
+        return 'UPDATE %s SET %s WHERE id = ?' % (table, fields_values)
+
+
+    @staticmethod
+    @functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _insert_statement(table, fields, generated_position = False):
+        """Return the text of an INSERT request on the given fields. If
+        'generated_position' is True, the 'position' field's value is
+        computed as in insert_object. Results are cached."""
+        if len(fields) == 0:
+            return 'INSERT INTO %s DEFAULT VALUES' % table
+        values = ['?' for field in fields]
+        if generated_position:
+            values[fields.index('position')] = DB._next_position_sql(table, 'parent_id' in fields)
+        return 'INSERT INTO %s (%s) VALUES (%s)' % (table, ','.join(fields), ','.join(values))
+
+
+    def select_items(self, table, where = '', data = ()):
+        """Select the items of a table matching the given WHERE clause,
+        ordered by position, as lightweight Item objects (see rows.Item)
+        rather than dictionnaries."""
+        sql = 'SELECT %s FROM %s %s ORDER BY position, id' % (', '.join(rows.FIELDS[table]), table, where)
+        cur = self.execute_sql(sql, data)
+        if cur is None:
+            return []
+        cur.row_factory = rows.item_factory(table)
+        items = cur.fetchall()
+        if metrics.registry.enabled:
+            metrics.record_rows(sql, len(items))
+        return items
 
-        # Get the WHERE args by getting the difference with sql_args
-        where_keys = set(args.keys()).difference(sql_keys)
-        where_args = {k:v for k,v in args.items() if k in where_keys}
 
-        return where_args, sql_args
+    def select_ids(self, table, ids):
+        """Return the items having the given ids, ordered by id."""
+        items = []
+        # Stay below SQLite's maximum number of variables
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = 'SELECT * FROM %s WHERE id IN (%s) ORDER BY id' % (table, ','.join('?' * len(chunk)))
+            items += self.select_sql(sql, tuple(chunk))
+        return sorted(items, key=lambda item: item['id'])
 
 
-    def _format_fields_values(self, *args):
+    @staticmethod
+    def _format_fields_values(*args):
         """Return an array of strings, each string being in the form
         'field = ?'."""
         if len(args) == 0:
@@ -207,16 +806,18 @@ class DB:
         return ['%s = ?' % field for field in args]
 
 
-    def _format_and_condition(self, *args):
+    @staticmethod
+    def _format_and_condition(*args):
         """Return a WHERE condition with every named argument received
         using an AND condition."""
         if len(args) == 0:
             return ''
-        fields_values = self._format_fields_values(*args)
+        fields_values = DB._format_fields_values(*args)
         return 'WHERE ' + ' AND '.join(fields_values)
 
 
-    def _format_sql_args(self, args = {}):
+    @staticmethod
+    def _format_sql_args(args = {}):
         """Return formated SQL arguments as a string.
         Keys are uppercased and '_' are replaced with spaces, then trimmed.
         Values can be either a unique value or a list. None values are ignored.
@@ -236,13 +837,32 @@ class DB:
                 commands.append(key)
             else:
                 value = args[key]
-                if isinstance(value, list):
+                if isinstance(value, (list, tuple)):
                     value = ', '.join(value)
                 commands.append('%s %s' % (key, value))
 
         return ' '.join(commands)
 
 
+    def update_items(self, table, items):
+        """Update several items, represented as dictionnaries holding their
+        'id' and the fields to update, within a single transaction."""
+        # Group the items updating the same fields to update them at once
+        groups = {}
+        for item in items:
+            args = {k:v for k,v in item.items() if k[0] != '_' and k != 'id' and v != None}
+            if len(args) > 0:
+                groups.setdefault(tuple(args.keys()), []).append((item['id'], args))
+
+        with self.transaction():
+            for fields, group in groups.items():
+                sql = self._update_statement(table, fields)
+                data = [tuple(args.values()) + (id,) for id, args in group]
+                if self.execute_sql(sql, data, many=True) is None:
+                    return
+                self._record_changes('update', table, group)
+
+
     def update_item(self, table, id, args = {}, **kwargs):
         """Update the specified item's fields with the given values."""
         if len(kwargs) > 0:
@@ -250,10 +870,12 @@ class DB:
         args = {k:v for k,v in args.items() if k[0] != '_' and v != None}
         if len(args) == 0:
             return
-        fields_values = ', '.join(self._format_fields_values(*args.keys()))
         data = tuple(args.values()) + (id,)
-        sql = 'UPDATE %s SET %s WHERE id = ?' % (table, fields_values)
-        self.execute_sql(sql, data)
+        sql = self._update_statement(table, tuple(args.keys()))
+        with self.transaction():
+            cur = self.execute_sql(sql, data)
+            if cur != None and cur.rowcount > 0:
+                self._record_change('update', table, id, args)
 
 
     def move_item(self, table, id, new_position, parent_id = None):
@@ -272,48 +894,64 @@ class DB:
         if new_position is None:
             return None
 
-        item = self.select(table, unique = True, id = id)
-
-        if item is None:
-            return None
+        with self.transaction():
+            item = self.select(table, unique = True, id = id)
 
-        # Item's parent has changed ?
-        if parent_id != None and 'parent_id' in item and parent_id != item['parent_id']:
-            # Update affected items from both old and new parents
-            # Move up the old parent's items from old_position+1 to last
-            self._reposition_items(table, direction='up', min_position=item['position']+1, parent_id=item['parent_id'])
-            # Move down the new parent's items from new_position to last
-            self._reposition_items(table, direction='down', min_position=new_position, parent_id=parent_id)
-
-            self.update_item(table, id, position=new_position)
-            self.update_item(table, id, parent_id=parent_id)
-        elif item['position'] != new_position:
-            if 'parent_id' in item:
-                parent_id = item['parent_id']
-            if item['position'] > new_position: # move item up
-                # Move down items from new_position to old_position-1
-                self._reposition_items(table, direction='down', min_position=new_position, max_position=item['position']-1, parent_id=parent_id)
-            else: # move item down
-                # Move up items from old_position+1 to new_position
-                self._reposition_items(table, direction='up', min_position=item['position']+1, max_position=new_position, parent_id=parent_id)
+            if item is None:
+                return None
 
-            self.update_item(table, id, position=new_position)
+            # Item's parent has changed ?
+            if parent_id != None and 'parent_id' in item and parent_id != item['parent_id']:
+                # Update affected items from both old and new parents
+                # Move up the old parent's items from old_position+1 to last
+                self._reposition_items(table, direction='up', min_position=item['position']+1, parent_id=item['parent_id'])
+                # Move down the new parent's items from new_position to last
+                self._reposition_items(table, direction='down', min_position=new_position, parent_id=parent_id)
+
+                self.update_item(table, id, position=new_position)
+                self.update_item(table, id, parent_id=parent_id)
+            elif item['position'] != new_position:
+                if 'parent_id' in item:
+                    parent_id = item['parent_id']
+                if item['position'] > new_position: # move item up
+                    # Move down items from new_position to old_position-1
+                    self._reposition_items(table, direction='down', min_position=new_position, max_position=item['position']-1, parent_id=parent_id)
+                else: # move item down
+                    # Move up items from old_position+1 to new_position
+                    self._reposition_items(table, direction='up', min_position=item['position']+1, max_position=new_position, parent_id=parent_id)
+
+                self.update_item(table, id, position=new_position)
 
 
     def _reposition_items(self, table, direction, min_position, max_position = None, parent_id = None):
-        """Increase or decrease a range of items' position."""
-        items_to_move = self._select_items_to_move(table = table, min_position = min_position, max_position = max_position, parent_id = parent_id)
-
+        """Increase or decrease a range of items' position using a single
+        UPDATE request."""
         amount = -1 if direction == 'up' else +1
 
-        for item in items_to_move:
-            new_position = item['position'] + amount
-            self.update_item(table, item['id'], position=new_position)
+        where, data = self._format_range_condition(min_position, max_position, parent_id)
+        sql = 'UPDATE %s SET position = position + ? %s' % (table, where)
+        with self.transaction():
+            cur = self.execute_sql(sql, (amount,) + data)
+            if cur != None and cur.rowcount > 0:
+                self._record_change('shift', table, None, {
+                    'parent_id': parent_id,
+                    'min_position': min_position,
+                    'max_position': max_position,
+                    'amount': amount,
+                })
 
 
     def _select_items_to_move(self, table, min_position, max_position = None, parent_id = None):
         """Return items inside a range of positions having the given parent."""
-        sql = 'SELECT * FROM %s WHERE position >= ?' % table
+        where, data = self._format_range_condition(min_position, max_position, parent_id)
+        sql = 'SELECT * FROM %s %s' % (table, where)
+        return self.select_sql(sql, data)
+
+
+    def _format_range_condition(self, min_position, max_position = None, parent_id = None):
+        """Return a WHERE condition matching the items inside a range of
+        positions having the given parent, along with its data."""
+        sql = 'WHERE position >= ?'
         data = (min_position,)
 
         if max_position is not None:
@@ -324,41 +962,203 @@ class DB:
             sql += ' AND parent_id = ?'
             data = data + (parent_id,)
 
-        return self.select_sql(sql, data)
+        return sql, data
+
+
+    def remove_items(self, table, ids):
+        """Remove several items within a single transaction."""
+        with self.transaction():
+            for id in ids:
+                self.remove_item(table, id)
 
 
     def remove_item(self, table, id):
         """Remove the specified item and move up it's following items."""
-        item = self.select(table, unique=True, id=id)
-        if item is None:
-            return
-        if 'parent_id' in item:
-            self._reposition_items(table, direction='up', min_position=item['position']+1, parent_id=item['parent_id'])
-        self._delete_item(table, id)
+        with self.transaction():
+            item = self.select(table, unique=True, id=id)
+            if item is None:
+                return
+            if 'parent_id' in item:
+                self._reposition_items(table, direction='up', min_position=item['position']+1, parent_id=item['parent_id'])
+            self._delete_item(table, id)
 
 
     def _delete_item(self, table, id):
         """Delete the specified item from the database."""
         sql = 'DELETE FROM %s WHERE id = ?' % table
         data = (id,)
-        self.execute_sql(sql, data)
+        with self.transaction():
+            cur = self.execute_sql(sql, data)
+            if cur != None and cur.rowcount > 0:
+                self._record_change('delete', table, id)
+
+
+    def _record_change(self, operation, table, id, data = None):
+        """Add a change to the change log. 'data' holds the inserted or
+        updated fields, or the range of a 'shift' of positions."""
+        self._record_changes(operation, table, [(id, data)])
+
+
+    def _record_changes(self, operation, table, changes):
+        """Add several changes, given as (id, data) tuples, to the change log."""
+        sql = 'INSERT INTO change_log (operation, table_name, item_id, data) VALUES (?, ?, ?, ?)'
+        data = [(operation, table, id, json.dumps(change)) for id, change in changes]
+        self._execute_bookkeeping(sql, data, many=True)
+
 
+    def _compact_change_log(self):
+        """Remove the oldest changes, keeping CHANGE_LOG_SIZE of them."""
+        sql = 'DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?'
+        self._execute_bookkeeping(sql, (self.CHANGE_LOG_SIZE,))
 
-    def get_items_with_descendants(self, table, parent_id = None, until = ''):
-        """Return items with the specified parent along with all
-        their descendants (childs, grand-childs, etc.)."""
-        items = self.select(table, _order_by='position', parent_id=parent_id)
 
-        child_table = self._get_child_table(table)
-        if until == table or child_table is None:
-            return items
+    def get_last_change_seq(self):
+        """Return the sequence number of the last recorded change."""
+        row = self.select_sql("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'", unique=True)
+        return row['seq'] if row is not None else 0
+
+
+    def get_changes(self, since):
+        """Return the changes recorded after the 'since' sequence number,
+        oldest first. Return None if some of these changes were removed
+        from the log, or if 'since' is unknown, in which case the client
+        has to reload the whole data."""
+        last = self.get_last_change_seq()
+        if since > last:
+            return None
+        if since == last:
+            return []
+
+        first = self.select_sql('SELECT MIN(seq) AS seq FROM change_log', unique=True)['seq']
+        if first is None or since < first - 1:
+            return None
+
+        sql = 'SELECT * FROM change_log WHERE seq > ? ORDER BY seq'
+        changes = self.select_sql(sql, (since,))
+        for change in changes:
+            change['data'] = json.loads(change['data'])
+        return changes
+
+
+    def get_items_with_descendants(self, table, parent_id = None, until = '', depth = None, id = None):
+        """Return items with the specified parent, or the item with the
+        specified id, along with all their descendants (childs,
+        grand-childs, etc.). Descendants are loaded down to the 'until'
+        table, or down to 'depth' levels below the items, whose 'content'
+        is left unset.
+
+        Each level of the tree is fetched with a single query, the rows
+        being then grouped by 'parent_id' to build the 'content' lists.
+        Items are returned as rows.Item objects."""
+        if id is not None:
+            where, data = 'WHERE id = ?', (id,)
+        elif parent_id is None:
+            where, data = '', ()
+        else:
+            where, data = 'WHERE parent_id = ?', (parent_id,)
 
-        for i, item in enumerate(items):
-            items[i]['content'] = self.get_items_with_descendants(childs_table, item['id'], until=until)
+        items = self.select_items(table, where, data)
+
+        # Ids of the current level's items, used as a sub-query to select
+        # the next level without sending every id back to the database
+        ids_sql = 'SELECT id FROM %s %s' % (table, where)
+        level_items = items
+        levels = 0
+
+        while until != table and (depth is None or levels < depth) and len(level_items) > 0:
+            child_table = self._get_child_table(table)
+            if child_table is None:
+                break
+
+            where = 'WHERE parent_id IN (%s)' % ids_sql
+            childs = self._group_by_parent(self.select_items(child_table, where, data))
+
+            for item in level_items:
+                item.content = childs.get(item.id, [])
+
+            ids_sql = 'SELECT id FROM %s WHERE parent_id IN (%s)' % (child_table, ids_sql)
+            level_items = [child for content in childs.values() for child in content]
+            table = child_table
+            levels += 1
 
         return items
 
 
+    def get_item_with_descendants(self, table, id, depth = None):
+        """Return the specified item along with its descendants, down to
+        'depth' levels below it, or None if it does not exist."""
+        items = self.get_items_with_descendants(table, depth=depth, id=id)
+        return items[0] if len(items) > 0 else None
+
+
+    def _group_by_parent(self, items):
+        """Return a dictionnary of the given items lists indexed by
+        their 'parent_id'. Items order is preserved."""
+        groups = {}
+        for item in items:
+            groups.setdefault(item.parent_id, []).append(item)
+        return groups
+
+
+    def search(self, query, limit = 20):
+        """Return the items whose name or url hold words starting with each
+        word of 'query', best matches first, names weighing more than urls.
+        Each result holds the item's 'type' (its table), 'id', 'rank' (lower
+        is better), the 'item' itself and its ancestors 'path', from its
+        slide to its parent."""
+        match = self._format_search_query(query)
+        if match is None:
+            return []
+
+        sql = 'SELECT rowid, bm25(search, 10.0, 1.0) AS rank FROM search WHERE search MATCH ? ORDER BY rank LIMIT ?'
+        hits = [(self.OBJ_TYPES[hit['rowid'] % 8], hit['rowid'] // 8, hit['rank'])
+                for hit in self.select_sql(sql, (match, limit))]
+
+        items = self._select_with_ancestors([(table, id) for table, id, rank in hits])
+        results = []
+        for table, id, rank in hits:
+            item = items[table].get(id)
+            if item is None:
+                continue
+            path = []
+            parent = item
+            for parent_table in reversed(self.OBJ_TYPES[:self.OBJ_TYPES.index(table)]):
+                parent = items[parent_table].get(parent['parent_id'])
+                if parent is None:
+                    break
+                path.insert(0, {'type': parent_table, 'id': parent['id'], 'name': parent['name']})
+            results.append({'type': table, 'id': id, 'rank': rank, 'item': item, 'path': path})
+        return results
+
+
+    @staticmethod
+    def _format_search_query(query):
+        """Return an FTS5 query matching the words of 'query' as prefixes,
+        or None if it holds no word."""
+        words = re.findall(r'\w+', query or '')
+        if len(words) == 0:
+            return None
+        return ' '.join('"%s"*' % word for word in words)
+
+
+    def _select_with_ancestors(self, items):
+        """Select the given (table, id) items along with their ancestors,
+        with a query per table. Return dictionnaries of the items indexed
+        by id, by table."""
+        ids = {table: set() for table in self.OBJ_TYPES}
+        for table, id in items:
+            ids[table].add(id)
+
+        selected = {}
+        for index in reversed(range(len(self.OBJ_TYPES))):
+            table = self.OBJ_TYPES[index]
+            selected[table] = {item['id']: item for item in self.select_ids(table, list(ids[table]))}
+            if index > 0:
+                ids[self.OBJ_TYPES[index - 1]].update(item['parent_id'] for item in selected[table].values()
+                                                      if item['parent_id'] is not None)
+        return selected
+
+
     def _get_child_table(self, table):
         return self._get_table_by_index(self.OBJ_TYPES.index(table) + 1)
 
@@ -0,0 +1,132 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TooManySubscribers(Exception):
+    """Raised when subscribing to a broker which has reached its maximum
+    number of subscribers."""
+
+
+class Stream:
+    """Messages of a subscriber. Its slot is released once the stream is
+    closed, even if it was never iterated."""
+
+    def __init__(self, broker, messages):
+        self._broker = broker
+        self._messages = messages
+        self._closed = False
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        return next(self._messages)
+
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._messages.close()
+        self._broker._unsubscribe()
+
+
+class EventBroker:
+    """Broadcast the data version to Server-Sent Events subscribers.
+    Subscribers all wait on a single condition and read the same shared
+    version, so idle subscribers cost no work and publishing does not
+    depend on how many of them are connected."""
+
+    # Delay before a client reconnects after losing the stream, in ms
+    RETRY = 3000
+
+    def __init__(self, heartbeat=15, max_subscribers=None):
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.version = None
+        self.subscribers = 0
+        self._condition = threading.Condition()
+
+
+    def publish(self, version):
+        """Notify the subscribers of a new data version. Older versions,
+        which can be received out of order, are ignored."""
+        with self._condition:
+            if self.version is not None and version <= self.version:
+                return
+            self.version = version
+            self._condition.notify_all()
+
+
+    def watch(self, read_version, interval=1.0):
+        """Poll the data version with 'read_version' every 'interval'
+        seconds, from a daemon thread, and publish it. This lets the
+        subscribers of a process be notified of the writes made by other
+        processes, such as the other workers of a server. Polling only
+        happens while there are subscribers."""
+        def poll():
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.subscribers > 0)
+                try:
+                    self.publish(read_version())
+                except Exception:
+                    logger.exception('Could not read the data version')
+                time.sleep(interval)
+
+        thread = threading.Thread(target=poll, name='events-watch', daemon=True)
+        thread.start()
+        return thread
+
+
+    def subscribe(self, last_event_id=None):
+        """Return a Stream of Server-Sent Events messages, which must be
+        closed. A 'change' event, whose id is the data version, is sent as
+        soon as the version differs from the last one received by the
+        client ('last_event_id'). A comment is sent every 'heartbeat'
+        seconds otherwise. Raise TooManySubscribers if 'max_subscribers'
+        streams are open already."""
+        with self._condition:
+            if self.max_subscribers is not None and self.subscribers >= self.max_subscribers:
+                raise TooManySubscribers('%d subscribers already' % self.subscribers)
+            self.subscribers += 1
+            self._condition.notify_all()
+        return Stream(self, self._messages(self._parse_event_id(last_event_id)))
+
+
+    def _unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+
+    def _messages(self, last_version):
+        yield 'retry: %d\n\n' % self.RETRY
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.version not in (None, last_version),
+                                         timeout=self.heartbeat)
+                version = self.version
+
+            if version in (None, last_version):
+                yield ': heartbeat\n\n'
+                continue
+
+            last_version = version
+            data = json.dumps({'data_version': version})
+            yield 'id: %d\nevent: change\ndata: %s\n\n' % (version, data)
+
+
+    def _parse_event_id(self, event_id):
+        try:
+            return int(event_id)
+        except (TypeError, ValueError):
+            return None
+
+
+broker = EventBroker()
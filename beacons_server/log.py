@@ -0,0 +1,89 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction ('rate') of the records whose level is
+    lower than or equal to 'level'. Records of higher levels always pass."""
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+
+    def filter(self, record):
+        return record.levelno > self.level or random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Put records on a queue as they are. Unlike QueueHandler, messages
+    are not formatted by the logging thread but by the queue's listener."""
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, sql_level=logging.INFO, sql_sample_rate=1.0,
+                  slow_query_level=logging.WARNING, handler=None):
+    """Send the 'beacons_server' logs to 'handler' (stderr by default)
+    through a queue, so that threads logging a record never wait for I/O.
+
+    SQL requests are logged at DEBUG level by the 'beacons_server.sql'
+    logger, only a 'sql_sample_rate' fraction of them being kept, and slow
+    requests at WARNING level by 'beacons_server.sql.slow'.
+    Return the queue's listener, which is stopped at exit."""
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(FORMAT))
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger('beacons_server')
+    root.handlers = [DeferredQueueHandler(records)]
+    root.setLevel(level)
+    root.propagate = False
+
+    sql_logger = logging.getLogger('beacons_server.sql')
+    sql_logger.setLevel(sql_level)
+    sql_logger.filters = []
+    if sql_sample_rate < 1:
+        sql_logger.addFilter(SamplingFilter(sql_sample_rate))
+
+    logging.getLogger('beacons_server.sql.slow').setLevel(slow_query_level)
+
+    listener.start()
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener):
+    """Stop a queue listener after it handled the queued records, unless it
+    is already stopped."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def init_app(app):
+    """Set up logging according to the application's configuration:
+    'LOG_LEVEL', 'SQL_LOG_LEVEL', 'SQL_LOG_SAMPLE_RATE' and
+    'SLOW_QUERY_THRESHOLD' (in seconds, None to disable)."""
+    from beacons_server.db import DB
+
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('SQL_LOG_LEVEL', 'INFO')
+    app.config.setdefault('SQL_LOG_SAMPLE_RATE', 1.0)
+    app.config.setdefault('SLOW_QUERY_THRESHOLD', 0.1)
+
+    DB.SLOW_QUERY_THRESHOLD = app.config['SLOW_QUERY_THRESHOLD']
+    return setup_logging(
+        level=app.config['LOG_LEVEL'],
+        sql_level=app.config['SQL_LOG_LEVEL'],
+        sql_sample_rate=app.config['SQL_LOG_SAMPLE_RATE'],
+    )
@@ -0,0 +1,172 @@
+import functools
+import re
+import threading
+import time
+from flask import request
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('"', '\\"')) for name, value in pairs)
+
+
+class Counter:
+    """Sum of values, by labels."""
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, format_labels(zip(self.label_names, labels)), value))
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values among cumulative buckets, by labels."""
+
+    def __init__(self, name, help, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # Labels -> [count per bucket (not cumulated), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value, labels=()):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[0][i] += 1
+                    break
+            values[1] += value
+            values[2] += 1
+
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for labels, (buckets, total, count) in sorted(self._values.items()):
+                labels = list(zip(self.label_names, labels))
+                cumulated = 0
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    cumulated += bucket_count
+                    lines.append('%s_bucket%s %d' % (self.name, format_labels(labels, [('le', bound)]), cumulated))
+                lines.append('%s_bucket%s %d' % (self.name, format_labels(labels, [('le', '+Inf')]), count))
+                lines.append('%s_sum%s %s' % (self.name, format_labels(labels), total))
+                lines.append('%s_count%s %d' % (self.name, format_labels(labels), count))
+        return lines
+
+
+class Registry:
+    """Hold the application's metrics. When 'enabled' is False, callers are
+    expected not to record anything, so that metrics cost a single
+    attribute lookup."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+
+    def add_collector(self, collector):
+        """Register a callable returning a list of (name, type, help, value)
+        tuples, read each time the metrics are rendered."""
+        self._collectors.append(collector)
+
+
+    def render(self):
+        """Return the metrics in Prometheus' text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            for name, type, help, value in collector():
+                lines += ['# HELP %s %s' % (name, help), '# TYPE %s %s' % (name, type), '%s %s' % (name, value)]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+sql_duration = registry.histogram('beacons_sql_duration_seconds', 'Duration of the SQL requests.', ('operation',))
+sql_requests = registry.counter('beacons_sql_requests_total', 'Number of SQL requests.', ('operation', 'table'))
+sql_rows = registry.counter('beacons_sql_rows_total', 'Number of rows selected or modified by SQL requests.', ('operation', 'table'))
+sql_errors = registry.counter('beacons_sql_errors_total', 'Number of failed SQL requests.', ('operation',))
+handler_duration = registry.histogram('beacons_handler_duration_seconds', 'Duration of the resources\' handlers.', ('endpoint', 'method'))
+
+
+SQL_TABLE_REGEX = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def sql_labels(sql):
+    """Return the operation (first keyword) and the table of an SQL request."""
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    match = SQL_TABLE_REGEX.search(sql)
+    return operation, match.group(1) if match is not None else ''
+
+
+def record_sql(sql, duration, rows=None):
+    operation, table = sql_labels(sql)
+    sql_duration.observe(duration, (operation,))
+    sql_requests.inc((operation, table))
+    if rows is not None and rows > 0:
+        sql_rows.inc((operation, table), rows)
+
+
+def record_rows(sql, rows):
+    """Record the number of rows fetched by a SELECT request."""
+    sql_rows.inc(sql_labels(sql), rows)
+
+
+def record_sql_error(sql):
+    sql_errors.inc((sql_labels(sql)[0],))
+
+
+def timed(method):
+    """Decorate a resource's handler to record its duration, labelled with
+    the request's endpoint and HTTP method."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            labels = (request.endpoint, request.method)
+            handler_duration.observe(time.perf_counter() - start, labels)
+    return wrapper
@@ -0,0 +1,43 @@
+import queue
+from beacons_server.db import DB
+
+class ConnectionPool:
+    """Keep a bounded set of open DB handles so that they can be reused
+    across requests instead of opening a new connection each time."""
+
+    def __init__(self, db_path, size=8, pragmas=None, silent=False):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self.silent = silent
+        self._idle = queue.LifoQueue(maxsize=size)
+
+
+    def acquire(self):
+        """Return an idle DB handle, or a new one if none is available."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return DB(self.db_path, silent=self.silent, pragmas=self.pragmas)
+
+
+    def release(self, db):
+        """Give back a DB handle to the pool. Any pending transaction is
+        rolled back. The handle is closed if the pool is already full."""
+        if db.conn is None:
+            return
+        if db.conn.in_transaction:
+            db.rollback()
+        try:
+            self._idle.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+
+    def close(self):
+        """Close every idle DB handle."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,81 @@
+import dataclasses
+import operator
+
+# Columns of each table, in the order in which they are selected
+FIELDS = {
+    'slide': ('id', 'position', 'name'),
+    'row': ('id', 'parent_id', 'position', 'name', 'css'),
+    'column': ('id', 'parent_id', 'position', 'name'),
+    'box': ('id', 'parent_id', 'position', 'name'),
+    'bookmark': ('id', 'parent_id', 'position', 'name', 'icon', 'url'),
+}
+
+
+class Item:
+    """Base class of the rows loaded to build the trees of items.
+
+    Rows are stored in __slots__ rather than in a dictionnary each, which
+    makes them several times smaller. They can still be read as mappings,
+    and are turned into dictionnaries only while being serialized. The
+    'content' slot holding an item's children is left unset on the items
+    whose children were not loaded."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+
+    def to_dict(self):
+        """Return the item as a dictionnary. Its children, if any, are kept
+        as they are."""
+        item = dict(zip(self.FIELDS, self._values(self)))
+        if hasattr(self, 'content'):
+            item['content'] = self.content
+        return item
+
+
+def make_item_class(table, fields):
+    return dataclasses.make_dataclass(
+        table.capitalize(),
+        fields,
+        bases=(Item,),
+        namespace={
+            '__slots__': fields + ('content',),
+            'FIELDS': fields,
+            '_values': staticmethod(operator.attrgetter(*fields)),
+        },
+        eq=False,
+    )
+
+
+ITEM_CLASSES = {table: make_item_class(table, fields) for table, fields in FIELDS.items()}
+
+
+def item_factory(table):
+    """Return a row factory creating items of the given table from rows
+    selected in the order of FIELDS."""
+    cls = ITEM_CLASSES[table]
+    return lambda cursor, row: cls(*row)
@@ -0,0 +1,127 @@
+import json
+from flask import current_app, make_response
+from beacons_server.rows import Item
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj):
+    """Serialize the objects unknown to the backends, such as the items
+    of the trees."""
+    if isinstance(obj, Item):
+        return obj.to_dict()
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+class JSONBackend:
+    """Serialize data with the standard library's json module."""
+
+    def dumps(self, data, pretty=False):
+        if pretty:
+            return json.dumps(data, indent=4, sort_keys=True, default=default) + '\n'
+        return json.dumps(data, separators=(',', ':'), default=default)
+
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+    def iterdumps(self, data):
+        """Yield the serialized data in chunks, one per item of a list, so
+        that only one item is serialized in memory at a time. Chunks may be
+        either str or bytes."""
+        if not isinstance(data, list):
+            yield self.dumps(data)
+            return
+
+        yield '['
+        for index, item in enumerate(data):
+            if index > 0:
+                yield ','
+            yield self.dumps(item)
+        yield ']'
+
+
+class OrjsonBackend(JSONBackend):
+    """Serialize data with orjson, several times faster than json."""
+
+    def dumps(self, data, pretty=False):
+        # Items are dataclasses, which orjson would serialize without their
+        # 'content' slot: pass them to default() instead
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+        if pretty:
+            option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(data, default=default, option=option)
+
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+BACKENDS = {'json': JSONBackend()}
+if orjson is not None:
+    BACKENDS['orjson'] = OrjsonBackend()
+
+DEFAULT_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Size of the chunks sent when streaming a response
+CHUNK_SIZE = 64 * 1024
+
+
+class Stream:
+    """Wrap a resource's data so that it is serialized incrementally while
+    being sent, instead of being built as a whole string in memory."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def get_backend():
+    return BACKENDS[current_app.config['JSON_BACKEND']]
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json. Responses are
+    compact unless JSON_PRETTY is set, which it is by default in debug."""
+    backend = get_backend()
+    pretty = current_app.config.get('JSON_PRETTY', current_app.debug)
+
+    if isinstance(data, Stream) and not pretty:
+        response = current_app.response_class(buffered(backend.iterdumps(data.data)), mimetype='application/json')
+        response.status_code = code
+    else:
+        if isinstance(data, Stream):
+            data = data.data
+        response = make_response(backend.dumps(data, pretty), code)
+        response.mimetype = 'application/json'
+
+    response.headers.extend(headers or {})
+    return response
+
+
+def buffered(chunks, size=None):
+    """Group small chunks together so that each write sends about `size`
+    bytes."""
+    size = size or CHUNK_SIZE
+    buffer, length = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if len(buffer) > 0:
+        yield b''.join(buffer)
+
+
+def init_app(app, api):
+    app.config.setdefault('JSON_BACKEND', DEFAULT_BACKEND)
+    if app.config['JSON_BACKEND'] not in BACKENDS:
+        raise ValueError("Unknown JSON backend '%s', expected one of %s"
+                         % (app.config['JSON_BACKEND'], ', '.join(sorted(BACKENDS))))
+    api.representation('application/json')(output_json)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Serve the frontend's files (dist/) efficiently.
+
+- Files whose name holds a content hash (app.56a0c436.js) never change and
+  are cached by clients for a year, others must be revalidated after
+  STATIC_MAX_AGE seconds.
+- Precompressed variants of the files (app.js.br, app.js.gz) are served to
+  the clients accepting their encoding. Run this module to create them:
+  python -m beacons_server.static [dist]
+- Files are sent with send_file(), which lets servers providing
+  wsgi.file_wrapper (gunicorn) send them with sendfile(2), without reading
+  them in Python.
+- index.html is kept in memory, along with its compressed variants, and
+  read again when the file is modified.
+"""
+
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import Response, abort, current_app, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings of the precompressed variants, by order of preference, along
+# with their file extension
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Files whose content may be compressed, other ones (images, fonts) being
+# compressed already
+COMPRESSIBLE = ('.html', '.js', '.css', '.map', '.json', '.svg', '.txt', '.ico')
+
+# Name of the files generated by the frontend's build, holding a hash of
+# their content, such as 'app.56a0c436.js' or 'breakfast.a66be4de.jpg'
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8}\.[^/]+$')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class Index:
+    """index.html along with its compressed variants, and the modification
+    time of the file which was read."""
+
+    def __init__(self, path, mtime):
+        self.mtime = mtime
+        with open(path, 'rb') as file:
+            self.content = file.read()
+        self.etag = hashlib.sha1(self.content).hexdigest()[:16]
+        self.variants = {'gzip': gzip.compress(self.content, 9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.content)
+
+
+def init_app(app, folder):
+    """Serve the files of 'folder' at the root of the application, and its
+    index.html on '/'. The application must be created with
+    static_folder=None."""
+    app.config.setdefault('STATIC_FOLDER', os.path.join(app.root_path, folder))
+    app.config.setdefault('STATIC_MAX_AGE', 3600)
+    app.extensions['static_index'] = None
+
+    app.add_url_rule('/', 'index', send_index)
+    app.add_url_rule('/<path:filename>', 'static', send_static)
+
+
+def get_index():
+    """Return the Index of the application's index.html, which is read
+    again if the file was modified since, a single stat() call, so that a
+    new build never serves an index.html referring to removed files.
+    Return None if there is no index.html."""
+    path = os.path.join(current_app.config['STATIC_FOLDER'], 'index.html')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        index = current_app.extensions['static_index']
+        if index is None or index.mtime != mtime:
+            index = current_app.extensions['static_index'] = Index(path, mtime)
+    except FileNotFoundError:
+        return None
+    return index
+
+
+def send_index():
+    index = get_index()
+    if index is None:
+        abort(404)
+
+    encoding = negotiate(index.variants)
+    response = Response(index.variants[encoding] if encoding else index.content, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Always revalidated, so that new builds are picked up right away, the
+    # ETag being a hash of the content
+    response.cache_control.no_cache = True
+    response.set_etag('%s-%s' % (index.etag, encoding or 'identity'))
+    return response.make_conditional(request)
+
+
+def send_static(filename):
+    folder = current_app.config['STATIC_FOLDER']
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    variants = get_variants(path)
+    encoding = negotiate(variants)
+
+    immutable = HASHED_NAME.search(filename) is not None
+    max_age = IMMUTABLE_MAX_AGE if immutable else current_app.config['STATIC_MAX_AGE']
+
+    try:
+        served = path + dict(ENCODINGS)[encoding] if encoding else path
+        response = send_file(served, mimetype=mimetype, max_age=max_age, conditional=True)
+    except FileNotFoundError:
+        # The variant was removed since it was found
+        encoding = None
+        response = send_file(path, mimetype=mimetype, max_age=max_age, conditional=True)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if len(variants) > 0:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def negotiate(encodings):
+    """Return the preferred encoding among the given ones accepted by the
+    current request, or None to send the identity."""
+    for encoding, extension in ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def get_variants(path):
+    """Return the encodings of the precompressed variants of a file which
+    are at least as recent as the file. They are looked up on each request,
+    a few stat() calls, so that rebuilt or removed files are picked up."""
+    mtime = os.stat(path).st_mtime_ns
+    variants = []
+    for encoding, extension in ENCODINGS:
+        try:
+            if os.stat(path + extension).st_mtime_ns >= mtime:
+                variants.append(encoding)
+        except FileNotFoundError:
+            pass
+    return tuple(variants)
+
+
+def compress_folder(folder, min_size=1024):
+    """Write the precompressed variants of the compressible files of a
+    folder, when they are smaller than the file. Return the number of files
+    written."""
+    written = 0
+    for directory, _, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if not filename.endswith(COMPRESSIBLE) or os.path.getsize(path) < min_size:
+                continue
+
+            with open(path, 'rb') as file:
+                content = file.read()
+            variants = [('.gz', gzip.compress(content, 9))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(content)))
+
+            for extension, compressed in variants:
+                if len(compressed) < len(content):
+                    with open(path + extension, 'wb') as file:
+                        file.write(compressed)
+                    written += 1
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the precompressed variants of the frontend files.')
+    parser.add_argument('folder', nargs='?', default='dist')
+    args = parser.parse_args()
+
+    print('%d files written%s' % (compress_folder(args.folder), '' if brotli else ' (brotli is not installed)'))
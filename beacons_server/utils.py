@@ -1,11 +1,85 @@
-import os
+from flask import current_app, g, has_app_context
 from beacons_server import db
+from beacons_server.pool import ConnectionPool
 
 DB_PATH = 'beacons.sqlite'
+DB_POOL_SIZE = 8
+# Pre-forking servers create the tables once, before starting the workers
+DB_CREATE_TABLES = True
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,
+}
+
+
+def init_app(app):
+    """Bind a DB connection pool to the Flask application. Handles are
+    taken from the pool by get_db() and given back when the application
+    context is torn down.
+    The pool is configured through the 'DB_PATH', 'DB_POOL_SIZE',
+    'DB_PRAGMAS' and 'DB_BUSY_TIMEOUT' (in seconds) configuration keys.
+    The database tables are created or upgraded in place if needed, unless
+    'DB_CREATE_TABLES' is False."""
+    app.config.setdefault('DB_PATH', DB_PATH)
+    app.config.setdefault('DB_POOL_SIZE', DB_POOL_SIZE)
+    app.config.setdefault('DB_PRAGMAS', DB_PRAGMAS)
+    app.config.setdefault('DB_BUSY_TIMEOUT', db.DB.BUSY_TIMEOUT)
+    app.config.setdefault('DB_CREATE_TABLES', DB_CREATE_TABLES)
+
+    db.DB.BUSY_TIMEOUT = app.config['DB_BUSY_TIMEOUT']
+
+    if app.config['DB_CREATE_TABLES']:
+        db.DB(app.config['DB_PATH'], create_tables=True, silent=True).close()
+
+    init_pool(app)
+    app.teardown_appcontext(close_db)
+
+
+def init_pool(app):
+    """Create the application's DB connection pool. Called again by each
+    worker process of a pre-forking server, as SQLite connections must not
+    be used across a fork: the parent's idle handles are dropped without
+    being closed."""
+    app.extensions['db_pool'] = ConnectionPool(
+        app.config['DB_PATH'],
+        size=app.config['DB_POOL_SIZE'],
+        pragmas=app.config['DB_PRAGMAS']
+    )
+
+
+def get_db_path():
+    if has_app_context():
+        return current_app.config.get('DB_PATH', DB_PATH)
+    return DB_PATH
+
 
 def get_db():
-    return db.DB(DB_PATH, silent=False)
+    """Return the DB handle of the current application context. Outside
+    of an application context, a new handle is created."""
+    if not has_app_context() or 'db_pool' not in current_app.extensions:
+        return db.DB(get_db_path(), silent=False)
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    """Give back the current application context's DB handle to the pool."""
+    handle = g.pop('db', None)
+    if handle is not None:
+        current_app.extensions['db_pool'].release(handle)
+
+
+def get_data_version():
+    """Return the database's data version (see DB.get_data_version), read
+    once per application context."""
+    if not has_app_context():
+        return get_db().get_data_version()
+    if 'data_version' not in g:
+        g.data_version = get_db().get_data_version()
+    return g.data_version
 
 
 def get_db_last_modification():
-    return os.path.getmtime(DB_PATH)
+    return get_db().get_data_version()['last_modification']
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the time needed to back up a database, to export its items as
+newline-delimited JSON and to import them back into a new database, along
+with the growth of the process' peak memory during the export.
+
+Usage: python -m benchmarks.bench_backup [--bookmarks 1000000]
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from beacons_server import backup
+from beacons_server.db import DB
+
+
+def fill_database(db, nb_bookmarks):
+    nb_boxes = nb_bookmarks // 50 + 1
+    with db.transaction():
+        db.conn.execute("INSERT INTO slide (id, position, name) VALUES (1, 0, 'Slide')")
+        db.conn.execute("INSERT INTO row (id, parent_id, position, name) VALUES (1, 1, 0, 'Row')")
+        db.conn.execute("INSERT INTO column (id, parent_id, position, name) VALUES (1, 1, 0, 'Column')")
+        db.conn.executemany('INSERT INTO box (parent_id, position, name) VALUES (1, ?, ?)',
+                            ((i, 'Box %d' % i) for i in range(nb_boxes)))
+        db.conn.executemany('INSERT INTO bookmark (name, url, parent_id, position) VALUES (?, ?, ?, ?)',
+                            (('Bookmark %d' % i, 'https://example.com/%d' % i, i // 50 + 1, i % 50)
+                             for i in range(nb_bookmarks)))
+
+
+def max_rss():
+    """Return the peak resident memory of the process, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bookmarks', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite')
+        db = DB(path, create_tables=True, silent=True)
+        fill_database(db, args.bookmarks)
+        print('%d bookmarks, %.0f MB database' % (args.bookmarks, os.path.getsize(path) / 1e6))
+
+        start = time.perf_counter()
+        backup.backup(db, os.path.join(directory, 'backup.sqlite'))
+        print('backup: %8.2f s' % (time.perf_counter() - start))
+
+        export = os.path.join(directory, 'export.ndjson')
+        rss = max_rss()
+        start = time.perf_counter()
+        snapshot = backup.Snapshot(db)
+        with open(export, 'wb') as file:
+            file.writelines(backup.export_lines(snapshot.db))
+        snapshot.close()
+        duration = time.perf_counter() - start
+        print('export: %8.2f s %10.0f items/s, %.0f MB, peak memory +%.0f MB'
+              % (duration, args.bookmarks / duration, os.path.getsize(export) / 1e6, max_rss() - rss))
+
+        start = time.perf_counter()
+        count = backup.import_file(export, os.path.join(directory, 'import.sqlite'))
+        duration = time.perf_counter() - start
+        print('import: %8.2f s %10.0f items/s' % (duration, count / duration))
+        db.close()
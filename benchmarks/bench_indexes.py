@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare children lookups on the bookmark table before and after the
+(parent_id, position) indexes are created.
+
+Usage: python -m benchmarks.bench_indexes [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from beacons_server.db import DB
+
+
+BOOKMARKS_PER_BOX = 50
+LOOKUPS = 200
+
+
+def fill_database(db, nb_bookmarks):
+    """Insert 'nb_bookmarks' bookmarks spread among boxes."""
+    rows = ((i // BOOKMARKS_PER_BOX + 1, i % BOOKMARKS_PER_BOX, 'Bookmark %d' % i, 'https://example.com/%d' % i)
+            for i in range(nb_bookmarks))
+    with db.transaction():
+        db.conn.executemany('INSERT INTO bookmark (parent_id, position, name, url) VALUES (?, ?, ?, ?)', rows)
+
+
+def time_lookups(db, nb_boxes):
+    """Return the average duration of a box's children lookup, in ms."""
+    parent_ids = [random.randint(1, nb_boxes) for i in range(LOOKUPS)]
+    start = time.perf_counter()
+    for parent_id in parent_ids:
+        db.select('bookmark', _order_by='position', parent_id=parent_id)
+    return (time.perf_counter() - start) * 1000 / LOOKUPS
+
+
+def query_plan(db):
+    sql = 'EXPLAIN QUERY PLAN SELECT * FROM bookmark WHERE parent_id = 1 ORDER BY position'
+    return db.select_sql(sql, unique=True)['detail']
+
+
+def bench(nb_bookmarks):
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(os.path.join(directory, 'bench.sqlite'), silent=True)
+        # Create the tables at version 0, without any index
+        for sql in DB.SQL_TABLES.values():
+            db.execute_sql(sql)
+        fill_database(db, nb_bookmarks)
+        nb_boxes = nb_bookmarks // BOOKMARKS_PER_BOX
+
+        scan_plan, scan = query_plan(db), time_lookups(db, nb_boxes)
+        db.upgrade_schema()
+        seek_plan, seek = query_plan(db), time_lookups(db, nb_boxes)
+        db.close()
+
+    print('%9d bookmarks: %9.3f ms -> %7.3f ms per lookup (x%.0f)' % (nb_bookmarks, scan, seek, scan / seek))
+    print('    before: %s' % scan_plan)
+    print('    after:  %s' % seek_plan)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench(size)
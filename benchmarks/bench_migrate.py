@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the throughput of migrate_db.py on a generated legacy database,
+and compare it with the previous migration, which selected the link of
+each item with its own request and inserted items one by one.
+
+The previous migration being quadratic, it is run on a smaller database.
+
+Usage: python -m benchmarks.bench_migrate [--bookmarks 1000000] [--baseline 5000]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import migrate_db
+from beacons_server.db import DB
+
+LEGACY_SCHEMA = """
+CREATE TABLE slide (id integer PRIMARY KEY, title text, position integer, css text);
+CREATE TABLE row (id integer PRIMARY KEY, title text, css text);
+CREATE TABLE column (id integer PRIMARY KEY, title text);
+CREATE TABLE box (id integer PRIMARY KEY, title text);
+CREATE TABLE bookmark (id integer PRIMARY KEY, title text, url text, icon text);
+CREATE TABLE slide_row (slide_id integer, row_id integer, position integer);
+CREATE TABLE row_column (row_id integer, column_id integer, position integer);
+CREATE TABLE column_box (column_id integer, box_id integer, position integer);
+CREATE TABLE box_bookmark (box_id integer, bookmark_id integer, position integer);
+"""
+
+
+def create_legacy_db(path, nb_bookmarks):
+    """Create a legacy database holding 'nb_bookmarks' bookmarks, 50 per
+    box, each level holding 5 items per parent."""
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    nb_boxes = nb_bookmarks // 50 + 1
+    nb_columns = nb_boxes // 5 + 1
+    nb_rows = nb_columns // 5 + 1
+    nb_slides = nb_rows // 5 + 1
+
+    conn.executemany('INSERT INTO slide VALUES (?, ?, ?, NULL)', ((i, 'Slide %d' % i, i) for i in range(nb_slides)))
+    for table, parent, count, per_parent in [('row', 'slide', nb_rows, 5), ('column', 'row', nb_columns, 5),
+                                             ('box', 'column', nb_boxes, 5), ('bookmark', 'box', nb_bookmarks, 50)]:
+        conn.executemany('INSERT INTO %s (id, title) VALUES (?, ?)' % table,
+                         ((i, '%s %d' % (table, i)) for i in range(count)))
+        conn.executemany('INSERT INTO %s_%s VALUES (?, ?, ?)' % (parent, table),
+                         ((i // per_parent, i, i % per_parent) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+def migrate_one_by_one(db1, db2):
+    """The previous migration, one request per item."""
+    parent_ids = None
+    for type_index, table in enumerate(DB.OBJ_TYPES):
+        ids = {}
+        items = db1.select(table, orderBy='id')
+        if type_index > 0:
+            parent_type = DB.OBJ_TYPES[type_index - 1]
+            sql = 'SELECT * FROM %s_%s WHERE %s_id = ?' % (parent_type, table, table)
+            for item in items:
+                row = db1.select_sql(sql, (item['id'],), unique=True)
+                if row != None:
+                    item['position'] = row['position']
+                    item['parent_id'] = parent_ids.get(row[parent_type + '_id'])
+
+        with db2.transaction():
+            for item in items:
+                old_id = item.pop('id')
+                item['name'] = item.pop('title')
+                if type_index == 0:
+                    del item['css']
+                ids[old_id] = db2.insert_object(table, item)
+        parent_ids = ids
+
+
+def measure(directory, name, nb_bookmarks, function):
+    source = os.path.join(directory, '%s.db' % name)
+    target = os.path.join(directory, '%s.sqlite' % name)
+    create_legacy_db(source, nb_bookmarks)
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        function(source, target)
+    duration = time.perf_counter() - start
+    print('%-14s %8d bookmarks %8.2f s %10.0f bookmarks/s' % (name, nb_bookmarks, duration, nb_bookmarks / duration))
+
+
+def baseline(source, target):
+    db1, db2 = DB(source, silent=True), DB(target, create_tables=True, silent=True)
+    migrate_one_by_one(db1, db2)
+    db1.close()
+    db2.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bookmarks', type=int, default=1000000)
+    parser.add_argument('--baseline', type=int, default=5000,
+                        help='number of bookmarks migrated by the previous migration')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        measure(directory, 'one by one', args.baseline, baseline)
+        measure(directory, 'streamed', args.baseline,
+                lambda source, target: migrate_db.migrate(source, target, args.chunk_size))
+        measure(directory, 'streamed (big)', args.bookmarks,
+                lambda source, target: migrate_db.migrate(source, target, args.chunk_size))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the time needed to fetch a page of bookmarks at increasing
+depths with LIMIT/OFFSET and with keyset pagination (select_page), and
+the time needed to select the whole table at once.
+
+Usage: python -m benchmarks.bench_pagination [--bookmarks 1000000] [--limit 100]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from beacons_server.db import DB
+
+
+def fill_database(db, nb_bookmarks):
+    rows = (('Bookmark %d' % i, 'https://example.com/%d' % i, i // 50) for i in range(nb_bookmarks))
+    with db.transaction():
+        db.conn.executemany('INSERT INTO bookmark (name, url, parent_id) VALUES (?, ?, ?)', rows)
+
+
+def measure(function, number=20):
+    start = time.perf_counter()
+    for i in range(number):
+        function()
+    return (time.perf_counter() - start) / number * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bookmarks', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(os.path.join(directory, 'bench.sqlite'), silent=True)
+        # Create the tables only, the search index is not needed here
+        for sql in DB.SQL_TABLES.values():
+            db.execute_sql(sql)
+        fill_database(db, args.bookmarks)
+
+        offset_sql = 'SELECT * FROM bookmark ORDER BY id LIMIT ? OFFSET ?'
+        for depth in [0, args.bookmarks // 10, args.bookmarks // 2, args.bookmarks - args.limit]:
+            offset = measure(lambda: db.select_sql(offset_sql, (args.limit, depth)))
+            keyset = measure(lambda: db.select_page('bookmark', after=depth, limit=args.limit))
+            print('page at %8d: OFFSET %8.2f ms, keyset %6.2f ms' % (depth, offset, keyset))
+
+        start = time.perf_counter()
+        db.select('bookmark', orderBy='id')
+        print('whole table:  %8.0f ms' % ((time.perf_counter() - start) * 1000))
+        db.close()
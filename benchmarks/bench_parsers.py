@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the requests per second served by the item resources when the
+request parsers are built for every request and when they are built once
+per resource class.
+
+Usage: python -m benchmarks.bench_parsers [--requests 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from beacons_server import utils
+
+utils.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_parsers.sqlite')
+
+import api
+from resources.basic_resource import BasicResource
+
+
+def build_parsers(self):
+    """Rebuild the parsers on each instantiation, as resources did before."""
+    cls = self.__class__
+    cls.set_general_parser()
+    cls.set_get_parser()
+    cls.set_full_parser()
+    cls.set_batch_parser()
+
+
+def bench(name, client, urls, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+    duration = time.perf_counter() - start
+    print('%-24s %8.0f requests/s' % (name, requests / duration))
+    return duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    api.app.config['METRICS_ENABLED'] = False
+    client = api.app.test_client()
+    slide = client.post('/slides', json={'name':'Slide'}).get_json()
+    row = client.post('/rows', json={'name':'Row', 'parent_id':slide['id']}).get_json()
+    urls = ['/slides/%d' % slide['id'], '/rows/%d' % row['id'], '/rows?parent_id=%d' % slide['id']]
+
+    bench('warm up', client, urls, args.requests // 10)
+
+    BasicResource.__init__ = build_parsers
+    before = bench('parsers per request', client, urls, args.requests)
+    del BasicResource.__init__
+    after = bench('parsers per class', client, urls, args.requests)
+    print('%-24s x%.2f' % ('', before / after))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the duration, peak memory and number of allocated blocks of a
+full tree load with one dictionnary per row and with rows.Item objects.
+
+Usage: python -m benchmarks.bench_rows [--bookmarks 100000]
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from beacons_server import serialization
+from beacons_server.db import DB
+
+CHILDREN = 10
+
+
+def fill_database(db, nb_bookmarks):
+    """Insert a tree holding 'nb_bookmarks' bookmarks, each item having
+    CHILDREN children."""
+    with db.transaction():
+        parents = [None]
+        for table in DB.OBJ_TYPES:
+            nb_items = max(1, nb_bookmarks // CHILDREN ** (len(DB.OBJ_TYPES) - 1 - DB.OBJ_TYPES.index(table)))
+            items = [{'name': '%s %d' % (table, i), 'position': i // len(parents),
+                      'parent_id': parents[i % len(parents)]} for i in range(nb_items)]
+            if table == 'slide':
+                items = [{'name': item['name'], 'position': i} for i, item in enumerate(items)]
+            if table == 'bookmark':
+                for item in items:
+                    item['url'] = 'https://example.com/%s' % item['name']
+            parents = db.insert_objects(table, items)
+
+
+def load_dicts(db, table):
+    """Load the tree with one dictionnary per row, as the items were
+    loaded before rows.Item."""
+    ids_sql = 'SELECT id FROM %s' % table
+    items = level_items = db.select_sql('SELECT * FROM %s ORDER BY position, id' % table)
+    while len(level_items) > 0 and db._get_child_table(table) is not None:
+        table = db._get_child_table(table)
+        sql = 'SELECT * FROM %s WHERE parent_id IN (%s) ORDER BY position, id' % (table, ids_sql)
+        childs = {}
+        for item in db.select_sql(sql):
+            childs.setdefault(item['parent_id'], []).append(item)
+        for item in level_items:
+            item['content'] = childs.get(item['id'], [])
+        ids_sql = 'SELECT id FROM %s WHERE parent_id IN (%s)' % (table, ids_sql)
+        level_items = [child for content in childs.values() for child in content]
+    return items
+
+
+def measure(name, load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = load()
+    duration = time.perf_counter() - start
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-8s %8.0f ms %8.1f MB peak %10d blocks' % (name, duration * 1e3, peak / 1e6, blocks))
+    return tree, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bookmarks', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(os.path.join(directory, 'bench.sqlite'), create_tables=True, silent=True)
+        fill_database(db, args.bookmarks)
+
+        dicts, before = measure('dicts', lambda: load_dicts(db, 'slide'))
+        items, after = measure('items', lambda: db.get_items_with_descendants('slide'))
+        print('%-8s x%.1f less memory' % ('', before / after))
+
+        backend = serialization.BACKENDS[serialization.DEFAULT_BACKEND]
+        assert backend.dumps(dicts) == backend.dumps(items)
+        for name, tree in [('dicts', dicts), ('items', items)]:
+            start = time.perf_counter()
+            backend.dumps(tree)
+            print('%-8s %8.0f ms to serialize' % (name, (time.perf_counter() - start) * 1e3))
+        db.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare searching bookmarks by name and url with LIKE patterns, which
+scan the whole table, and with the full-text search index returning the
+20 best matches.
+
+Usage: python -m benchmarks.bench_search [--bookmarks 100000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from beacons_server.db import DB
+
+WORDS = ['python', 'recipe', 'linux', 'docs', 'vegan', 'tutorial', 'sqlite', 'flask', 'bread', 'ubuntu',
+         'croissant', 'github', 'kernel', 'music', 'travel', 'garden', 'physics', 'cinema', 'coffee', 'chess']
+QUERIES = ['pyth', 'sqlite tuto', 'croissant', 'git kern', 'zzz']
+BOOKMARKS_PER_BOX = 50
+
+
+def fill_database(db, nb_bookmarks):
+    random.seed(0)
+    with db.transaction():
+        slide = db.insert_object('slide', {'name': 'Slide'})
+        row = db.insert_object('row', {'name': 'Row', 'parent_id': slide})
+        column = db.insert_object('column', {'name': 'Column', 'parent_id': row})
+        boxes = db.insert_objects('box', [{'name': 'Box %d' % i, 'parent_id': column}
+                                          for i in range(nb_bookmarks // BOOKMARKS_PER_BOX)])
+        bookmarks = []
+        for i in range(nb_bookmarks):
+            words = random.sample(WORDS, 3)
+            bookmarks.append({'name': '%s %s %d' % (words[0].title(), words[1], i),
+                              'url': 'https://%s.example.com/%d' % (words[2], i),
+                              'parent_id': boxes[i // BOOKMARKS_PER_BOX]})
+        db.insert_objects('bookmark', bookmarks)
+
+
+def search_like(db, query):
+    """Search the bookmarks whose name or url contain every word, the way
+    it could be done without the index. Every match is selected, as they
+    must all be known to rank them."""
+    words = query.split()
+    condition = ' AND '.join(['(name LIKE ? OR url LIKE ?)'] * len(words))
+    data = [pattern for word in words for pattern in ['%' + word + '%'] * 2]
+    return db.select_sql('SELECT * FROM bookmark WHERE %s' % condition, tuple(data))
+
+
+def bench(name, function):
+    durations = []
+    for query in QUERIES:
+        start = time.perf_counter()
+        for i in range(10):
+            function(query)
+        durations.append((time.perf_counter() - start) / 10 * 1000)
+    print('%-10s %s' % (name, '  '.join('%-11s %6.2f ms' % (query, duration) for query, duration in zip(QUERIES, durations))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bookmarks', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(os.path.join(directory, 'bench.sqlite'), create_tables=True, silent=True)
+        start = time.perf_counter()
+        fill_database(db, args.bookmarks)
+        print('%d bookmarks inserted and indexed in %.1f s' % (args.bookmarks, time.perf_counter() - start))
+
+        bench('LIKE', lambda query: search_like(db, query))
+        bench('index', lambda query: db.search(query))
+        db.close()
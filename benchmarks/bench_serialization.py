@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the time spent serializing a large /beacons tree with
+Flask-RESTful's default encoder and with each serialization backend.
+
+Usage: python -m benchmarks.bench_serialization [--slides 20] [--width 8]
+"""
+
+import argparse
+import json
+import timeit
+
+from beacons_server import serialization
+
+
+def build_tree(slides, width):
+    """Build a tree shaped like the one returned by /beacons, with `width`
+    children per item below the slides."""
+    ids = iter(range(1, 10 ** 9))
+
+    def item(position, content=None, **fields):
+        item = {'id': next(ids), 'position': position, 'name': 'Item %d' % position, 'parent_id': 1, **fields}
+        if content is not None:
+            item['content'] = content
+        return item
+
+    bookmarks = lambda: [item(i, url='https://example.com/%d' % i, icon='') for i in range(width)]
+    boxes = lambda: [item(i, bookmarks(), css='') for i in range(width)]
+    columns = lambda: [item(i, boxes()) for i in range(width)]
+    rows = lambda: [item(i, columns(), css='') for i in range(width)]
+    return [item(i, rows()) for i in range(slides)]
+
+
+def restful_dumps(data):
+    """Serialize the data as Flask-RESTful's output_json does outside debug."""
+    return json.dumps(data) + "\n"
+
+
+def bench(name, function, number):
+    duration = min(timeit.repeat(function, number=number, repeat=5)) / number
+    print('%-24s %8.2f ms' % (name, duration * 1e3))
+    return duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--slides', type=int, default=20)
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    tree = build_tree(args.slides, args.width)
+    size = len(restful_dumps(tree))
+    print('%d slides, %.1f MB of JSON' % (args.slides, size / 1e6))
+
+    before = bench('flask-restful', lambda: restful_dumps(tree), args.number)
+    for name, backend in serialization.BACKENDS.items():
+        after = bench(name, lambda: backend.dumps(tree), args.number)
+        print('%-24s x%.1f' % ('', before / after))
+
+        streamed = lambda: max(len(chunk) for chunk in serialization.buffered(backend.iterdumps(tree)))
+        bench('%s, streamed' % name, streamed, args.number)
+        print('%-24s %8.0f kB largest chunk' % ('', streamed() / 1e3))
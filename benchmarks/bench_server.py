@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the throughput of the development server, as started by
+'make server', with the production server started by serve.py.
+
+Each server is started on a temporary database holding a small tree, then
+loaded by concurrent clients using keep-alive connections, which request
+in turn /beacons, a slide and the list of rows.
+
+Usage: python -m benchmarks.bench_server [--clients 16] [--duration 10]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEV_SERVER = "import api; api.app.run(debug=True, use_reloader=False, port=%d)"
+
+SETTINGS = """DB_PATH = %r
+LOG_LEVEL = 'WARNING'
+SLOW_QUERY_THRESHOLD = None
+"""
+
+
+def start(command, port, settings):
+    env = dict(os.environ, BEACONS_SETTINGS=settings)
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for i in range(100):
+        try:
+            http.client.HTTPConnection('127.0.0.1', port, timeout=1).request('GET', '/slides')
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Could not start %s' % ' '.join(command))
+
+
+def fill(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'}
+
+    def post(url, item):
+        conn.request('POST', url, json.dumps(item), headers)
+        return json.loads(conn.getresponse().read())
+
+    slide = post('/slides', {'name': 'Slide'})
+    for i in range(5):
+        row = post('/rows', {'name': 'Row %d' % i, 'parent_id': slide['id']})
+        column = post('/columns', {'name': 'Column', 'parent_id': row['id']})
+        box = post('/boxes', {'name': 'Box', 'parent_id': column['id']})
+        post('/bookmarks', [{'name': 'Bm %d' % j, 'url': 'https://example.com', 'parent_id': box['id']}
+                            for j in range(10)])
+    return ['/beacons', '/slides/%d' % slide['id'], '/rows?parent_id=%d' % slide['id']]
+
+
+def load(port, urls, clients, duration):
+    """Return the number of requests per second served to 'clients'
+    concurrent clients during 'duration' seconds, and the number of errors."""
+    counts, errors = [0] * clients, [0] * clients
+    end = time.perf_counter() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.perf_counter() < end:
+            try:
+                conn.request('GET', urls[counts[index] % len(urls)])
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[index] += 1
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+            counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start), sum(errors)
+
+
+def bench(name, command, port, args):
+    with tempfile.TemporaryDirectory() as directory:
+        settings = os.path.join(directory, 'settings.py')
+        with open(settings, 'w') as file:
+            file.write(SETTINGS % os.path.join(directory, 'bench.sqlite'))
+
+        process = start(command, port, settings)
+        try:
+            urls = fill(port)
+            load(port, urls, args.clients, 1)
+            throughput, errors = load(port, urls, args.clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print('%-32s %8.0f requests/s %6d errors' % (name, throughput, errors))
+    return throughput
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    print('%d clients, %d CPUs' % (args.clients, os.cpu_count()))
+    before = bench('dev server (debug)', [sys.executable, '-c', DEV_SERVER % args.port], args.port, args)
+    for workers in args.workers:
+        command = [sys.executable, 'serve.py', '--bind', '127.0.0.1:%d' % args.port, '--workers', str(workers)]
+        after = bench('serve.py, %d workers x 4 threads' % workers, command, args.port, args)
+        print('%-32s x%.2f' % ('', after / before))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the duration of DB.select() and DB.update_item() calls with and
+without the statement cache. The uncached calls run the same methods, the
+cached statement builders being replaced by the functions they wrap.
+
+Usage: python -m benchmarks.bench_statements [--calls 20000]
+"""
+
+import argparse
+import contextlib
+import timeit
+
+from beacons_server.db import DB
+
+
+@contextlib.contextmanager
+def uncached(*names):
+    """Replace the given cached statement builders of DB by the functions
+    they wrap during the block."""
+    builders = {name: DB.__dict__[name] for name in names}
+    try:
+        for name, builder in builders.items():
+            setattr(DB, name, staticmethod(builder.__func__.__wrapped__))
+        yield
+    finally:
+        for name, builder in builders.items():
+            setattr(DB, name, builder)
+
+
+def bench(name, function, calls):
+    duration = min(timeit.repeat(function, number=calls, repeat=5))
+    print('%-20s %6.2f us per call' % (name, duration / calls * 1e6))
+    return duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    db = DB(':memory:', create_tables=True, silent=True)
+    id = db.insert_object('bookmark', {'name': 'Joh', 'parent_id': 12, 'position': 0})
+    select_args = {'parent_id': 12, 'name': None, '_order_by': 'position', '_limit': None}
+
+    select = lambda: db.select('bookmark', args=select_args, id=id)
+    with uncached('_select_statement'):
+        expected = select()
+        before = bench('select, uncached', select, args.calls)
+    assert select() == expected
+    after = bench('select, cached', select, args.calls)
+    print('%-20s x%.2f' % ('', before / after))
+
+    update = lambda: db.update_item('bookmark', id, name='Joh', url='u')
+    with uncached('_update_statement'):
+        before = bench('update, uncached', update, args.calls)
+    after = bench('update, cached', update, args.calls)
+    print('%-20s x%.2f' % ('', before / after))
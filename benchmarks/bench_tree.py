@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the time needed to load the whole tree, as /beacons does, with
+the time needed to load a single slide's tree, as /slides/<id>/tree does,
+with and without a depth limit.
+
+Usage: python -m benchmarks.bench_tree [--slides 20] [--bookmarks 100000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from beacons_server.db import DB
+
+
+def fill_database(db, nb_slides, nb_bookmarks):
+    """Spread the bookmarks over the slides, 50 per box, with one row and
+    one column per slide."""
+    nb_boxes = nb_bookmarks // 50
+    with db.transaction():
+        db.conn.executemany('INSERT INTO slide (id, position, name) VALUES (?, ?, ?)',
+                            ((i, i, 'Slide %d' % i) for i in range(1, nb_slides + 1)))
+        for table in ['row', 'column']:
+            db.conn.executemany('INSERT INTO %s (id, parent_id, position, name) VALUES (?, ?, 0, ?)' % table,
+                                ((i, i, '%s %d' % (table, i)) for i in range(1, nb_slides + 1)))
+        db.conn.executemany('INSERT INTO box (id, parent_id, position, name) VALUES (?, ?, ?, ?)',
+                            ((i, i % nb_slides + 1, i, 'Box %d' % i) for i in range(1, nb_boxes + 1)))
+        db.conn.executemany('INSERT INTO bookmark (parent_id, position, name, url) VALUES (?, ?, ?, ?)',
+                            ((i // 50 + 1, i % 50, 'Bookmark %d' % i, 'https://example.com/%d' % i)
+                             for i in range(nb_boxes * 50)))
+
+
+def measure(function, number=10):
+    start = time.perf_counter()
+    for i in range(number):
+        function()
+    return (time.perf_counter() - start) / number * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--slides', type=int, default=20)
+    parser.add_argument('--bookmarks', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB(os.path.join(directory, 'bench.sqlite'), create_tables=True, silent=True)
+        fill_database(db, args.slides, args.bookmarks)
+
+        print('%d slides, %d bookmarks' % (args.slides, args.bookmarks))
+        print('whole tree:         %8.1f ms' % measure(lambda: db.get_items_with_descendants('slide')))
+        print('one slide:          %8.1f ms' % measure(lambda: db.get_item_with_descendants('slide', 1)))
+        print('one slide, depth 3: %8.1f ms' % measure(lambda: db.get_item_with_descendants('slide', 1, depth=3)))
+        db.close()
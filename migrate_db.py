@@ -1,88 +1,173 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""Migrate a legacy database, in which items are linked to their parent
+through 'parent_child' tables, to the current schema.
 
+Usage: python migrate_db.py [source] [target] [--chunk-size 10000] [--restart]
+
+The migration is written into 'target.migrating', then swapped in place
+of 'target' once complete. Each level of the tree is migrated within a
+single transaction, so an interrupted migration resumes from the first
+level which was not migrated. Items keep their ids.
+The server using 'target' must be stopped: a database in use is not
+replaced, the complete migration being kept until it is run again.
+"""
+
+import argparse
 import os
+import time
 import colorama
-from colorama import Fore, Back, Style
+from colorama import Fore, Style
 
-from beacons_server.db import DB
+from beacons_server.db import DB, DatabaseBusyError, remove_database, replace_database
+from beacons_server.log import setup_logging
+from beacons_server.rows import FIELDS
 
 
 colorama.init(autoreset=True)
 
+# Key of the meta table holding the number of levels already migrated
+PROGRESS_KEY = 'migrated_levels'
+
+# Number of skipped items which are printed for each level
+MAX_WARNINGS = 10
+
 
-def migrate_obj_type(db1, db2, type_index, parent_ids = None):
+def get_columns(db, table):
+    return [column['name'] for column in db.select_sql('PRAGMA table_info(%s)' % table)]
+
+
+def migrate_obj_type(db1, db2, type_index, chunk_size = 10000):
+    """Copy the items of a level from db1 to db2, within a single
+    transaction. Items are read with a single query joining their table with
+    its 'parent_child' table, then inserted by chunks. Items without a
+    migrated parent are skipped. Return the number of items migrated."""
     table = DB.OBJ_TYPES[type_index]
-    print('Migrating ' + Fore.BLUE + table + Style.RESET_ALL)
+    total = db1.select_sql('SELECT COUNT(*) AS count FROM %s' % table, unique=True)['count']
+    print('Migrating ' + Fore.BLUE + table + Style.RESET_ALL + ' (%d items)' % total)
 
-    items = db1.select(table, orderBy='id')
-    ids = {}
+    # Legacy columns and their name in the new table, 'title' being renamed
+    renamed = {'title': 'name'}
+    columns = [(column, renamed.get(column, column)) for column in get_columns(db1, table)]
+    columns = [(old, new) for old, new in columns if new in FIELDS[table] and new not in ('id', 'parent_id')]
+    select = ['t.id'] + ['t.%s' % old for old, new in columns]
+    fields = ['id'] + [new for old, new in columns]
 
-    # Retrieve item's 'position' and 'parent_id' fields
-    # from db1's 'parent_child' table.
+    # Retrieve item's 'position' and 'parent_id' fields from the link table
     if type_index > 0:
-        parent_type = DB.OBJ_TYPES[type_index - 1]
-        parent_child_table = f'{parent_type}_{table}'
-        id_field = f'{table}_id'
-        parent_id_field = f'{parent_type}_id'
-
-        for item in items:
-            sql = 'SELECT * FROM %s WHERE %s = ?' % (parent_child_table, id_field)
-            data = (item['id'],)
-            row = db1.select_sql(sql, data, unique=True)
-            if row != None:
-                item['position'] = row['position']
-                item['parent_id'] = row[parent_id_field]
-
-    # Add items inside the next db
-    for item in items:
-        # Check if item's parent exists
-        if type_index > 0:
-            if 'parent_id' not in item or item['parent_id'] is None:
-                # print(item['parent_id'])
-                print(Fore.YELLOW + 'Warning: ' + Style.RESET_ALL + 'the following item has no parent')
-                print(item)
+        parent_table = DB.OBJ_TYPES[type_index - 1]
+        link_table = '%s_%s' % (parent_table, table)
+        select = [field for field in select if field != 't.position'] + ['l.position', 'l.%s_id' % parent_table]
+        fields = [field for field in fields if field != 'position'] + ['position', 'parent_id']
+        join = 'LEFT JOIN %s l ON l.%s_id = t.id' % (link_table, table)
+        order = 'ORDER BY t.id, l.rowid'
+        parent_ids = set(row['id'] for row in db2.conn.execute('SELECT id FROM %s' % parent_table))
+    else:
+        join, order = '', 'ORDER BY t.id'
+
+    sql = 'SELECT %s FROM %s t %s %s' % (', '.join(select), table, join, order)
+    insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(fields), ', '.join('?' * len(fields)))
+
+    read, migrated, skipped = 0, 0, 0
+    last_id = None
+    chunk = []
+    start = time.perf_counter()
+
+    def insert(chunk):
+        if db2.execute_sql(insert_sql, chunk, many=True) is None:
+            raise RuntimeError('Could not insert the %s items' % table)
+
+    with db2.transaction():
+        for row in db1.execute_sql(sql):
+            # Items having several parents are linked to the first one
+            if row[0] == last_id:
                 continue
-            if item['parent_id'] not in parent_ids:
-                print(Fore.YELLOW + 'Warning: ' + Style.RESET_ALL + "the parent of the following item doesn't exist")
-                print(item)
+            last_id = row[0]
+            read += 1
+
+            if type_index > 0 and row[-1] not in parent_ids:
+                skipped += 1
+                if skipped <= MAX_WARNINGS:
+                    reason = 'has no parent' if row[-1] is None else "has a parent which doesn't exist"
+                    print(Fore.YELLOW + 'Warning: ' + Style.RESET_ALL + 'the following item %s' % reason)
+                    print(dict(zip(fields, row)))
                 continue
-            item['parent_id'] = parent_ids[item['parent_id']]
 
-        if item['id'] > 50:
-            db2.SILENT = True
+            chunk.append(tuple(row))
+            if len(chunk) >= chunk_size:
+                insert(chunk)
+                migrated += len(chunk)
+                chunk = []
+                report_progress(table, read, total, start)
 
-        old_id = item['id']
+        if len(chunk) > 0:
+            insert(chunk)
+            migrated += len(chunk)
 
-        # Rename keys
-        if 'title' in item:
-            item['name'] = item.pop('title')
+        db2.execute_sql('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (PROGRESS_KEY, type_index + 1))
 
-        # Remove unecessary attributes
-        del item['id']
-        if type_index == 0:
-            del item['css']
+    report_progress(table, read, total, start)
+    if skipped > 0:
+        print(Fore.YELLOW + 'Warning: ' + Style.RESET_ALL + '%d %s items skipped' % (skipped, table))
+    return migrated
 
-        new_id = db2.insert_object(table, item)
 
-        ids[old_id] = new_id
+def report_progress(table, read, total, start):
+    duration = time.perf_counter() - start
+    print('  %s: %d/%d (%.0f%%), %.0f items/s' % (table, read, total, read * 100 / max(total, 1),
+                                                  read / max(duration, 1e-6)))
 
-    return ids
 
+def get_migrated_levels(db):
+    row = db.select_sql('SELECT value FROM meta WHERE key = ?', (PROGRESS_KEY,), unique=True)
+    return row['value'] if row is not None else 0
 
-if __name__ == '__main__':
-    db1 = DB('beacons.db', silent=True)
 
-    os.remove('beacons.sqlite')
-    db2 = DB('beacons.sqlite', create_tables=True, silent=True)
+def migrate(source, target, chunk_size = 10000, restart = False):
+    """Migrate the 'source' legacy database into 'target', replacing it
+    once the migration is complete. Exit if 'target' is used by another
+    connection (see replace_database)."""
+    if not os.path.isfile(source):
+        raise SystemExit("The database '%s' does not exist" % source)
 
-    ids = None
+    temporary = target + '.migrating'
+    if restart:
+        remove_database(temporary)
 
-    for i in range(len(DB.OBJ_TYPES)):
-        if i == 4:
-            db2.SILENT = False
-        ids = migrate_obj_type(db1, db2, i, parent_ids=ids)
-        db2.SILENT = True
-        # if i == 3:
-        #     print(ids)
-        #     break
+    db1 = DB(source, silent=True)
+    db2 = DB(temporary, create_tables=True, silent=True)
+
+    levels = get_migrated_levels(db2)
+    if levels > 0:
+        print('Resuming after %s' % ', '.join(DB.OBJ_TYPES[:levels]))
+
+    for i in range(levels, len(DB.OBJ_TYPES)):
+        migrate_obj_type(db1, db2, i, chunk_size)
+
+    db2.execute_sql('DELETE FROM meta WHERE key = ?', (PROGRESS_KEY,))
+    db1.close()
+    db2.close()
+
+    try:
+        replace_database(temporary, target)
+    except DatabaseBusyError as e:
+        # Keep the migration complete, the next run only replaces 'target'
+        db2 = DB(temporary, silent=True)
+        db2.execute_sql('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (PROGRESS_KEY, len(DB.OBJ_TYPES)))
+        db2.close()
+        raise SystemExit('%s, stop the server then run the migration again' % e)
+    print('Migrated ' + Fore.BLUE + source + Style.RESET_ALL + ' to ' + Fore.BLUE + target)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('source', nargs='?', default='beacons.db')
+    parser.add_argument('target', nargs='?', default='beacons.sqlite')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='number of items inserted by each request (default: %(default)s)')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore the progress of a previous, interrupted migration')
+    args = parser.parse_args()
+
+    setup_logging()
+    migrate(args.source, args.target, args.chunk_size, args.restart)
@@ -1,32 +1,76 @@
+from types import SimpleNamespace
+from flask import request
 from flask_restful import reqparse, abort, Resource
+from werkzeug.exceptions import HTTPException
 from beacons_server import utils
+from beacons_server.rows import FIELDS
+from beacons_server.conditional import conditional
+from beacons_server.metrics import timed
+from resources.beacons import Beacons
+
+def item_id(value):
+    """Parser type of the items' ids. Unlike int(), it rejects booleans and
+    floats, which JSON bodies may hold."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('Expected an integer id')
+    return int(value)
+
 
 class BasicResource(Resource):
 
-    def __init__(self):
-        self.table = self.__class__.__name__.lower()
-        self.set_general_parser()
-        self.set_get_parser()
-        self.set_full_parser()
+    # Maximum number of items of a page, and number of items of the pages
+    # requested with 'after' but without 'limit'
+    MAX_PAGE_SIZE = 1000
+    DEFAULT_PAGE_SIZE = 100
+
+    method_decorators = {
+        'get': [conditional, timed],
+        'post': [timed],
+        'patch': [timed],
+        'delete': [timed],
+    }
+
+    def __init_subclass__(cls, **kwargs):
+        """Build the resource's table name and request parsers once, when
+        the class is defined, rather than for each request."""
+        super().__init_subclass__(**kwargs)
+        cls.table = cls.__name__.lower()
+        cls.set_general_parser()
+        cls.set_get_parser()
+        cls.set_full_parser()
+        cls.set_batch_parser()
+
+
+    @classmethod
+    def set_general_parser(cls):
+        cls.parser = reqparse.RequestParser()
+        cls.parser.add_argument('position', type=int)
+        cls.parser.add_argument('name', trim=True)
 
 
-    def set_general_parser(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('position', type=int)
-        self.parser.add_argument('name', trim=True)
+    @classmethod
+    def set_get_parser(cls):
+        cls.get_parser = cls.parser.copy()
+        cls.get_parser.add_argument('_group_by', trim=True)
+        cls.get_parser.add_argument('_order_by', trim=True)
+        cls.get_parser.add_argument('_asc', trim=bool)
+        cls.get_parser.add_argument('_desc', trim=bool)
+        cls.get_parser.add_argument('_limit', type=int)
+        # Pagination and projection
+        cls.get_parser.add_argument('after', type=int)
+        cls.get_parser.add_argument('limit', type=int)
+        cls.get_parser.add_argument('fields', trim=True)
 
+    @classmethod
+    def set_full_parser(cls):
+        cls.full_parser = cls.parser.copy()
+        cls.full_parser.replace_argument('name', default='', trim=True)
 
-    def set_get_parser(self):
-        self.get_parser = self.parser.copy()
-        self.get_parser.add_argument('_group_by', trim=True)
-        self.get_parser.add_argument('_order_by', trim=True)
-        self.get_parser.add_argument('_asc', trim=bool)
-        self.get_parser.add_argument('_desc', trim=bool)
-        self.get_parser.add_argument('_limit', trim=True)
 
-    def set_full_parser(self):
-        self.full_parser = self.parser.copy()
-        self.full_parser.replace_argument('name', default='', trim=True)
+    @classmethod
+    def set_batch_parser(cls):
+        cls.batch_parser = cls.parser.copy()
+        cls.batch_parser.add_argument('id', type=item_id, required=True)
 
 
     def abort_if_item_doesnt_exist(self, item):
@@ -36,52 +80,200 @@ class BasicResource(Resource):
 
     def get(self, id = None):
         args = self.get_parser.parse_args()
+        after, limit, fields = args.pop('after'), args.pop('limit'), self.parse_fields(args.pop('fields'))
+        if args['_order_by'] is not None:
+            args['_order_by'] = self.parse_columns(args['_order_by'], directions=True)
+        if args['_group_by'] is not None:
+            args['_group_by'] = self.parse_columns(args['_group_by'])
 
-        if id is None:
-            return utils.get_db().select(self.table, orderBy='id', args=args)
+        if after is None and limit is None and fields is None:
+            if id is None:
+                return utils.get_db().select(self.table, orderBy='id', args=args)
+
+            item = utils.get_db().select(self.table, unique=True, args=args, id=id)
+            self.abort_if_item_doesnt_exist(item)
+            return item
+
+        if any(key[0] == '_' and value is not None for key, value in args.items()):
+            abort(400, message='SQL commands cannot be combined with after, limit or fields, items being ordered by id')
+        if after is not None and limit is None:
+            limit = self.DEFAULT_PAGE_SIZE
+        if limit is not None:
+            if limit < 1:
+                abort(400, message='limit must be positive')
+            limit = min(limit, self.MAX_PAGE_SIZE)
+
+        if id is not None:
+            items, next = utils.get_db().select_page(self.table, fields=fields, args=args, id=id)
+            self.abort_if_item_doesnt_exist(items[0] if len(items) > 0 else None)
+            return items[0]
+
+        items, next = utils.get_db().select_page(self.table, after, limit, fields, args=args)
+        if after is None and limit is None:
+            return items
+        return {'items': items, 'next': next}
 
-        item = utils.get_db().select(self.table, unique=True, args=args, id=id)
-        self.abort_if_item_doesnt_exist(item)
 
-        return item
+    def parse_fields(self, fields):
+        """Return the list of fields of a comma separated 'fields' argument,
+        or None if it is not set. Abort if a field is unknown."""
+        if fields is None:
+            return None
+        fields = [field.strip() for field in fields.split(',') if field.strip() != '']
+        unknown = [field for field in fields if field not in FIELDS[self.table]]
+        if len(unknown) > 0:
+            abort(400, message='Unknown fields: %s. Expected some of: %s'
+                  % (', '.join(unknown), ', '.join(FIELDS[self.table])))
+        return fields
+
+
+    def parse_columns(self, value, directions = False):
+        """Return a comma separated list of columns, such as an '_order_by'
+        argument, normalized. Each column may be followed by ASC or DESC if
+        'directions' is True. Abort if a column is unknown, as the list is
+        put as is in the SQL request."""
+        columns = []
+        for column in value.split(','):
+            words = column.split()
+            valid = (len(words) == 1 or (directions and len(words) == 2 and words[1].upper() in ('ASC', 'DESC')))
+            if not valid or words[0] not in FIELDS[self.table]:
+                abort(400, message="Invalid column '%s'. Expected one of: %s%s"
+                      % (column.strip(), ', '.join(FIELDS[self.table]), ', followed by ASC or DESC' if directions else ''))
+            columns.append(' '.join([words[0]] + [word.upper() for word in words[1:]]))
+        return ', '.join(columns)
+
+
+    def parse_batch(self, parser):
+        """Parse every item of the request's JSON array with the given parser.
+        Abort if the request is not an array, or if any item is invalid, with
+        the errors of each invalid item indexed by its position."""
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            abort(400, message='Expected a JSON array')
+
+        parsed, errors = [], {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[index] = 'Expected a JSON object'
+                continue
+            try:
+                parsed.append(parser.parse_args(req=SimpleNamespace(json=item, values=None)))
+            except HTTPException as e:
+                errors[index] = e.data['message']
+
+        if len(errors) > 0:
+            abort(400, message=errors)
+        return parsed
+
+
+    def is_batch(self):
+        return isinstance(request.get_json(silent=True), list)
 
 
     def post(self):
+        if self.is_batch():
+            return self.post_batch()
+
         db = utils.get_db()
 
         args = self.full_parser.parse_args()
         id = db.insert_object(self.table, args)
+        Beacons.cache.clear()
 
         item = db.select(self.table, unique=True, id=id)
         return item, 201
 
 
-    def delete(self, id):
+    def post_batch(self):
+        db = utils.get_db()
+
+        items = self.parse_batch(self.full_parser)
+        ids = db.insert_objects(self.table, items)
+        if ids is None:
+            abort(400, message='Could not create the items')
+        Beacons.cache.clear()
+
+        return [{'id': item['id'], 'status': 201, 'item': item} for item in db.select_ids(self.table, ids)], 201
+
+
+    def delete(self, id = None):
+        if id is None:
+            return self.delete_batch()
+
         db = utils.get_db()
 
         item = db.select(self.table, unique=True, id=id)
         self.abort_if_item_doesnt_exist(item)
 
         db.remove_item(self.table, id)
+        Beacons.cache.clear()
 
         return '', 204
 
 
-    def patch(self, id):
+    def delete_batch(self):
+        db = utils.get_db()
+
+        ids = request.get_json(silent=True)
+        if not isinstance(ids, list) or not all(type(id) is int for id in ids):
+            abort(400, message='Expected a JSON array of ids')
+
+        with db.transaction():
+            existing_ids = set(item['id'] for item in db.select_ids(self.table, ids))
+            db.remove_items(self.table, [id for id in ids if id in existing_ids])
+        Beacons.cache.clear()
+
+        return [self.batch_result(id, 204, id in existing_ids) for id in ids], 200
+
+
+    def batch_result(self, id, status, found, item = None):
+        if not found:
+            return {'id': id, 'status': 404, 'message': 'Could not find the specified item'}
+        if item is None:
+            return {'id': id, 'status': status}
+        return {'id': id, 'status': status, 'item': item}
+
+
+    def patch(self, id = None):
+        if id is None:
+            return self.patch_batch()
+
         db = utils.get_db()
 
         args = self.parser.parse_args()
 
-        # Reposition item if needed
-        db.move_item(self.table, id=id, new_position=args.get('position'), parent_id=args.get('parent_id'))
+        with db.transaction():
+            # Reposition item if needed
+            db.move_item(self.table, id=id, new_position=args.get('position'), parent_id=args.get('parent_id'))
 
-        # Update other item's attributes if any
-        positionnal_keys = ['position', 'parent_id']
-        args = {k:v for k,v in args.items() if k not in positionnal_keys and v != None}
-        if len(args) > 0:
-            db.update_item(self.table, id=id, args=args)
+            # Update other item's attributes if any
+            positionnal_keys = ['position', 'parent_id']
+            args = {k:v for k,v in args.items() if k not in positionnal_keys and v != None}
+            if len(args) > 0:
+                db.update_item(self.table, id=id, args=args)
+        Beacons.cache.clear()
 
         updated_item = db.select(self.table, unique=True, id=id)
         if updated_item is None:
             self.abort_if_item_doesnt_exist(updated_item)
         return updated_item, 200
+
+
+    def patch_batch(self):
+        db = utils.get_db()
+
+        items = self.parse_batch(self.batch_parser)
+        ids = [item['id'] for item in items]
+
+        positionnal_keys = ['position', 'parent_id']
+        with db.transaction():
+            existing_ids = set(item['id'] for item in db.select_ids(self.table, ids))
+            items = [item for item in items if item['id'] in existing_ids]
+
+            for item in items:
+                db.move_item(self.table, id=item['id'], new_position=item.get('position'), parent_id=item.get('parent_id'))
+            db.update_items(self.table, [{k:v for k,v in item.items() if k not in positionnal_keys} for item in items])
+        Beacons.cache.clear()
+
+        updated_items = {item['id']: item for item in db.select_ids(self.table, list(existing_ids))}
+        return [self.batch_result(id, 200, id in existing_ids, updated_items.get(id)) for id in ids], 200
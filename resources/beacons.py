@@ -1,21 +1,38 @@
 from flask_restful import reqparse, abort, Resource
 from beacons_server import utils
+from beacons_server.cache import TreeCache
+from beacons_server.conditional import conditional
+from beacons_server.metrics import timed
+from beacons_server.serialization import Stream
 
 class Beacons(Resource):
 
+    method_decorators = {'get': [conditional, timed]}
+
     parser = reqparse.RequestParser()
     parser.add_argument('until', default='', trim=True)
     parser.add_argument('transform', type=bool, default=False)
 
+    # Assembled trees, invalidated by every write made through the resources.
+    # They are also indexed by data version, so that the writes made by other
+    # processes are not hidden by the cache, the trees of older versions
+    # being dropped.
+    cache = TreeCache(maxsize=16)
+
     def get(self):
         args = Beacons.parser.parse_args()
+        transform = args['transform'] and args['transform'] != 'false'
+
+        version = utils.get_data_version()['data_version']
+        key = (version, args['until'], transform)
+        beacons = Beacons.cache.get(key, lambda: self.build_beacons(args['until'], transform), version)
+        return Stream(beacons)
+
 
-        db = utils.get_db()
-        db.SILENT = True
-        beacons = db.get_items_with_descendants('slide', until=args['until'])
-        db.SILENT = False
+    def build_beacons(self, until, transform):
+        beacons = utils.get_db().get_items_with_descendants('slide', until=until)
 
-        if not args['transform'] or args['transform'] == 'false':
+        if not transform:
             return beacons
 
         grid_items = []
@@ -24,6 +41,7 @@ class Beacons(Resource):
         for slide in beacons:
             nb_rows = max(nb_rows, len(slide['content']))
             for index, row in enumerate(slide['content']):
+              row = row.to_dict()
               row['position'] = row['position'] + 1
               row['slideId'] = slide['id']
               row['slidePosition'] = slide['position'] + 1
@@ -0,0 +1,31 @@
+from flask_restful import reqparse, Resource
+from beacons_server import utils
+from beacons_server.metrics import timed
+
+class Changes(Resource):
+    """Changes made to the items since a given sequence number. Without
+    'since', only the current sequence number is returned: clients fetch it
+    before loading the whole tree, then poll for the following changes."""
+
+    method_decorators = [timed]
+
+    parser = reqparse.RequestParser()
+    parser.add_argument('since', type=int)
+
+    def get(self):
+        args = Changes.parser.parse_args()
+        db = utils.get_db()
+
+        if args['since'] is None:
+            return {'last': db.get_last_change_seq(), 'changes': []}
+
+        changes = db.get_changes(args['since'])
+        if changes is None:
+            return {
+                'message': 'Changes since %d are not available anymore, reload the whole data' % args['since'],
+                'resync': True,
+                'last': db.get_last_change_seq(),
+            }, 410
+
+        last = changes[-1]['seq'] if len(changes) > 0 else args['since']
+        return {'last': last, 'changes': changes}
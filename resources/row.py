@@ -2,6 +2,7 @@ from resources.child_resource import ChildResource
 
 class Row(ChildResource):
 
-    def set_general_parser(self):
-        ChildResource.set_general_parser(self)
-        self.parser.add_argument('css', trim=True)
+    @classmethod
+    def set_general_parser(cls):
+        super().set_general_parser()
+        cls.parser.add_argument('css', trim=True)
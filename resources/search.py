@@ -0,0 +1,21 @@
+from flask_restful import reqparse, Resource
+from beacons_server import utils
+from beacons_server.conditional import conditional
+from beacons_server.metrics import timed
+
+class Search(Resource):
+    """Full-text search of the items' names and urls. Every word of 'q'
+    must start a word of the item, so that partially typed words match."""
+
+    method_decorators = {'get': [conditional, timed]}
+
+    MAX_LIMIT = 100
+
+    parser = reqparse.RequestParser()
+    parser.add_argument('q', required=True, trim=True)
+    parser.add_argument('limit', type=int, default=20)
+
+    def get(self):
+        args = Search.parser.parse_args()
+        limit = min(max(args['limit'], 1), Search.MAX_LIMIT)
+        return utils.get_db().search(args['q'], limit)
@@ -0,0 +1,30 @@
+from flask_restful import reqparse, abort, Resource
+from beacons_server import utils
+from beacons_server.conditional import conditional
+from beacons_server.metrics import timed
+
+class Tree(Resource):
+    """An item along with its descendants, so that a single slide, or any
+    other part of the tree, can be loaded without the whole tree. 'depth'
+    limits the number of levels loaded below the item.
+    The resource is registered for each table, given as 'table' through
+    resource_class_kwargs."""
+
+    method_decorators = {'get': [conditional, timed]}
+
+    parser = reqparse.RequestParser()
+    parser.add_argument('depth', type=int)
+
+    def __init__(self, table):
+        self.table = table
+
+
+    def get(self, id):
+        args = Tree.parser.parse_args()
+        if args['depth'] is not None and args['depth'] < 0:
+            abort(400, message='depth must not be negative')
+
+        item = utils.get_db().get_item_with_descendants(self.table, id, args['depth'])
+        if item is None:
+            abort(404, message="Could not find the specified item")
+        return item
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Run the API with a production server: gunicorn, with several worker
+processes each running several threads.
+
+Usage: python serve.py [--bind 127.0.0.1:5001] [--workers 4] [--threads 4]
+
+Send SIGHUP to the master process (see --pid) to reload the application
+gracefully: new workers are started, and the old ones finish their
+requests before exiting, within --graceful-timeout seconds.
+Each Server-Sent Events stream (/beacons/events) keeps one of its worker's
+threads busy. A worker therefore accepts at most --threads - 1 streams,
+or EVENTS_MAX_SUBSCRIBERS if lower, so that a thread is always left for
+the other requests: further clients get a 503 response and poll
+/beacons/changes instead.
+The database's tables are created or upgraded once by the master process,
+on start and on reload, before the workers are started.
+
+When gunicorn is not installed, the API runs on Werkzeug's threaded
+server instead, in a single process.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+
+try:
+    import gunicorn.app.base
+except ImportError:
+    gunicorn = None
+
+logger = logging.getLogger('beacons_server.serve')
+
+
+def upgrade_schema(server):
+    """Create the database's tables, or upgrade their schema, before the
+    workers are started: workers upgrading it all at the same time would
+    wait for each other, and fail to boot if it takes longer than the
+    database's busy timeout. The upgrade runs in a new interpreter, so
+    that the master process does not import the API's modules, which the
+    workers started after a reload would inherit."""
+    process = multiprocessing.get_context('spawn').Process(target=create_tables)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        sys.exit('Could not create the tables of the database')
+
+
+def create_tables():
+    from flask import Config
+    from beacons_server import db, utils
+
+    config = Config(os.path.dirname(os.path.abspath(__file__)))
+    config.from_envvar('BEACONS_SETTINGS', silent=True)
+    db.DB(config.get('DB_PATH', utils.DB_PATH), create_tables=True, silent=True).close()
+
+
+def post_fork(server, worker):
+    """Workers only create their connection pool, the tables being
+    created by the master process."""
+    from beacons_server import utils
+
+    utils.DB_CREATE_TABLES = False
+
+
+def post_worker_init(worker):
+    """Initialize the resources of a worker once it has loaded the API."""
+    import api
+    from beacons_server import events, log, utils
+
+    if worker.cfg.preload_app:
+        # The DB handles and the logging thread of the master process
+        # cannot be used after the fork
+        log.init_app(api.app)
+        utils.init_pool(api.app)
+
+    # Each events' stream holds a thread, keep one for the other requests
+    limit = worker.cfg.threads - 1
+    if api.app.config.get('EVENTS_MAX_SUBSCRIBERS') is not None:
+        limit = min(limit, api.app.config['EVENTS_MAX_SUBSCRIBERS'])
+    events.broker.max_subscribers = limit
+
+    # Notify the events' subscribers of the writes made by other workers
+    interval = api.app.config.get('EVENTS_POLL_INTERVAL', 1.0)
+    if interval is not None:
+        path = api.app.config['DB_PATH']
+        events.broker.watch(lambda: read_data_version(path), interval)
+
+
+def read_data_version(path):
+    from beacons_server.db import DB
+
+    db = DB(path, silent=True)
+    try:
+        return db.get_data_version()['data_version']
+    finally:
+        db.close()
+
+
+if gunicorn is not None:
+
+    class Server(gunicorn.app.base.BaseApplication):
+        """Gunicorn application serving the API with the given settings."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+
+        def load(self):
+            import api
+            return api.app
+
+
+def get_options(args):
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'keepalive': args.keep_alive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'preload_app': args.preload,
+        'reload': args.reload,
+        'pidfile': args.pid,
+        'accesslog': args.access_log,
+        'on_starting': upgrade_schema,
+        'on_reload': upgrade_schema,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+    }
+
+
+def serve_with_werkzeug(args):
+    from werkzeug.serving import run_simple
+    import api
+
+    host, _, port = args.bind.rpartition(':')
+    logger.warning('gunicorn is not installed, serving with a single Werkzeug process')
+    run_simple(host or '127.0.0.1', int(port), api.app, threaded=True, use_reloader=args.reload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bind', default='127.0.0.1:5001',
+                        help='address to listen on (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1,
+                        help='number of worker processes (default: 2 * CPUs + 1)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='number of threads of each worker (default: %(default)s)')
+    parser.add_argument('--keep-alive', type=int, default=5,
+                        help='seconds an idle connection is kept open (default: %(default)s)')
+    parser.add_argument('--timeout', type=int, default=30,
+                        help='seconds after which a silent worker is restarted (default: %(default)s)')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='seconds given to workers to finish on reload (default: %(default)s)')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='restart workers after this many requests, 0 to disable (default: %(default)s)')
+    parser.add_argument('--preload', action='store_true',
+                        help='load the API once in the master process before forking the workers')
+    parser.add_argument('--reload', action='store_true',
+                        help='restart the workers when the code changes, for development')
+    parser.add_argument('--pid', default=None, help='file to write the master process id to')
+    parser.add_argument('--access-log', default=None, help="access log file, '-' for stderr")
+    args = parser.parse_args()
+
+    if gunicorn is None:
+        serve_with_werkzeug(args)
+    else:
+        Server(get_options(args)).run()
@@ -0,0 +1,321 @@
+import json
+import os
+import sqlite3
+import time
+import unittest
+from werkzeug.http import http_date
+from beacons_server import events
+from beacons_server import metrics
+from beacons_server import utils
+from beacons_server.db import DB
+
+utils.DB_PATH = 'test_api.sqlite'
+
+import api
+from resources.beacons import Beacons
+
+
+class APITest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(utils.DB_PATH, create_tables=True, silent=True)
+        self.client = api.app.test_client()
+        Beacons.cache.clear()
+
+
+    def tearDown(self):
+        self.db.close()
+        api.app.extensions['db_pool'].close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(utils.DB_PATH + suffix):
+                os.remove(utils.DB_PATH + suffix)
+
+
+    def create_tree(self):
+        slide = self.client.post('/slides', json={'name':'Slide'}).get_json()
+        row = self.client.post('/rows', json={'name':'Row', 'parent_id':slide['id']}).get_json()
+        column = self.client.post('/columns', json={'name':'Column', 'parent_id':row['id']}).get_json()
+        box = self.client.post('/boxes', json={'name':'Box', 'parent_id':column['id']}).get_json()
+        bookmark = self.client.post('/bookmarks', json={'name':'Bm', 'parent_id':box['id']}).get_json()
+        return slide, row, column, box, bookmark
+
+
+    def test_beacons_cache(self):
+        slide, row, column, box, bookmark = self.create_tree()
+
+        response = self.client.get('/beacons')
+        self.assertTrue(response.is_streamed)
+        beacons = response.get_json()
+        self.assertEqual(beacons[0]['content'][0]['content'][0]['content'][0]['content'][0]['name'], 'Bm')
+        self.assertEqual(self.client.get('/beacons').get_json(), beacons)
+        self.assertEqual(Beacons.cache.stats()['hits'], 1)
+
+        # Writes invalidate the cache
+        self.client.patch('/bookmarks/%d' % bookmark['id'], json={'name':'Renamed'})
+        beacons = self.client.get('/beacons').get_json()
+        self.assertEqual(beacons[0]['content'][0]['content'][0]['content'][0]['content'][0]['name'], 'Renamed')
+
+        self.client.delete('/slides/%d' % slide['id'])
+        self.assertEqual(self.client.get('/beacons').get_json(), [])
+
+        # Arguments are part of the cache key
+        self.client.post('/slides', json={'name':'Slide'})
+        self.assertNotIn('content', self.client.get('/beacons?until=slide').get_json()[0])
+        self.assertIn('content', self.client.get('/beacons').get_json()[0])
+
+
+    def test_parsers(self):
+        from resources.bookmark import Bookmark
+        from resources.child_resource import ChildResource
+        from resources.slide import Slide
+
+        # Parsers are built once per class, each with its own arguments
+        self.assertIs(Bookmark().full_parser, Bookmark().full_parser)
+        self.assertEqual(Bookmark.table, 'bookmark')
+        self.assertIn('url', [arg.name for arg in Bookmark.parser.args])
+        self.assertNotIn('url', [arg.name for arg in ChildResource.parser.args])
+        self.assertNotIn('parent_id', [arg.name for arg in Slide.parser.args])
+
+        slide = self.client.post('/slides', json={'name':'Slide'}).get_json()
+        self.assertEqual(self.client.post('/rows', json={'name':'Row'}).status_code, 400)
+        row = self.client.post('/rows', json={'name':'Row', 'parent_id':slide['id'], 'css':'a'}).get_json()
+        self.assertEqual(row['css'], 'a')
+
+
+    def test_database_busy(self):
+        slide = self.client.post('/slides', json={'name':'Slide'}).get_json()
+
+        settings = DB.BUSY_TIMEOUT, DB.BUSY_RETRIES
+        DB.BUSY_TIMEOUT, DB.BUSY_RETRIES = 0.01, 0
+        api.app.extensions['db_pool'].close()
+        other = sqlite3.connect(utils.DB_PATH, isolation_level=None)
+        try:
+            other.execute('BEGIN IMMEDIATE')
+            response = self.client.patch('/slides/%d' % slide['id'], json={'name':'Renamed'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(self.client.get('/slides/%d' % slide['id']).get_json()['name'], 'Slide')
+        finally:
+            DB.BUSY_TIMEOUT, DB.BUSY_RETRIES = settings
+            other.close()
+
+
+    def test_pagination(self):
+        slide, row, column, box, bookmark = self.create_tree()
+        self.client.delete('/bookmarks/%d' % bookmark['id'])
+        ids = [item['id'] for item in self.client.post('/bookmarks', json=[
+            {'name':'Bm %d' % i, 'url':'u', 'parent_id':box['id']} for i in range(5)]).get_json()]
+
+        # Walk through the pages
+        pages, url = [], '/bookmarks?limit=2'
+        while url is not None:
+            page = self.client.get(url).get_json()
+            pages.append([item['id'] for item in page['items']])
+            url = '/bookmarks?limit=2&after=%d' % page['next'] if page['next'] is not None else None
+        self.assertEqual(pages, [ids[:2], ids[2:4], ids[4:]])
+
+        # Pages requested without limit hold DEFAULT_PAGE_SIZE items
+        from resources.bookmark import Bookmark
+        Bookmark.DEFAULT_PAGE_SIZE = 3
+        try:
+            page = self.client.get('/bookmarks?after=0').get_json()
+            self.assertEqual([item['id'] for item in page['items']], ids[:3])
+            page = self.client.get('/bookmarks?after=%d' % page['next']).get_json()
+            self.assertEqual(page, {'items': page['items'], 'next': None})
+            self.assertEqual([item['id'] for item in page['items']], ids[3:])
+        finally:
+            del Bookmark.DEFAULT_PAGE_SIZE
+
+        # Projection, with or without pagination
+        page = self.client.get('/bookmarks?limit=1&fields=name,url').get_json()
+        self.assertEqual(page['items'], [{'id':ids[0], 'name':'Bm 0', 'url':'u'}])
+        items = self.client.get('/bookmarks?fields=name&name=Bm%203').get_json()
+        self.assertEqual(items, [{'id':ids[3], 'name':'Bm 3'}])
+        item = self.client.get('/bookmarks/%d?fields=url' % ids[1]).get_json()
+        self.assertEqual(item, {'id':ids[1], 'url':'u'})
+        self.assertEqual(self.client.get('/bookmarks/999?fields=url').status_code, 404)
+
+        # Ordering and grouping columns are validated
+        items = self.client.get('/bookmarks?_order_by=position%20desc,id').get_json()
+        self.assertEqual([item['id'] for item in items], ids[::-1])
+        self.assertEqual(self.client.get('/bookmarks?_group_by=parent_id').status_code, 200)
+        for query in ['_order_by=id;DROP%20TABLE%20bookmark', '_order_by=(SELECT%201)', '_order_by=nope',
+                      '_order_by=id%20sideways', '_group_by=parent_id%20DESC']:
+            self.assertEqual(self.client.get('/bookmarks?' + query).status_code, 400, query)
+
+        # The whole table is still returned without pagination
+        self.assertEqual(len(self.client.get('/bookmarks').get_json()), 5)
+
+        self.assertEqual(self.client.get('/bookmarks?fields=password').status_code, 400)
+        self.assertEqual(self.client.get('/bookmarks?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/bookmarks?limit=2&_order_by=name').status_code, 400)
+        self.assertEqual(self.client.get('/bookmarks?_limit=1%3B').status_code, 400)
+
+
+    def test_search(self):
+        slide, row, column, box, bookmark = self.create_tree()
+
+        results = self.client.get('/search?q=b').get_json()
+        self.assertEqual([(r['type'], r['id']) for r in results], [('box', box['id']), ('bookmark', bookmark['id'])])
+        self.assertEqual([p['id'] for p in results[1]['path']], [slide['id'], row['id'], column['id'], box['id']])
+        self.assertEqual(len(self.client.get('/search?q=b&limit=1').get_json()), 1)
+        self.assertEqual(self.client.get('/search').status_code, 400)
+
+
+    def test_tree(self):
+        slide, row, column, box, bookmark = self.create_tree()
+        self.client.post('/slides', json={'name':'Other'})
+
+        tree = self.client.get('/slides/%d/tree' % slide['id']).get_json()
+        self.assertEqual(tree['name'], 'Slide')
+        self.assertEqual(tree['content'][0]['content'][0]['content'][0]['content'][0]['id'], bookmark['id'])
+
+        tree = self.client.get('/columns/%d/tree?depth=1' % column['id']).get_json()
+        self.assertEqual([b['id'] for b in tree['content']], [box['id']])
+        self.assertNotIn('content', tree['content'][0])
+        self.assertNotIn('content', self.client.get('/bookmarks/%d/tree' % bookmark['id']).get_json())
+
+        self.assertEqual(self.client.get('/slides/999/tree').status_code, 404)
+        self.assertEqual(self.client.get('/slides/%d/tree?depth=-1' % slide['id']).status_code, 400)
+
+
+    def test_events_max_subscribers(self):
+        events.broker.max_subscribers = 0
+        try:
+            response = self.client.get('/beacons/events')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+        finally:
+            events.broker.max_subscribers = None
+
+        response = self.client.get('/beacons/events', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(events.broker.subscribers, 1)
+        response.close()
+        self.assertEqual(events.broker.subscribers, 0)
+
+
+    def test_export(self):
+        slide, row, column, box, bookmark = self.create_tree()
+
+        response = self.client.get('/export')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[-1])['id'], bookmark['id'])
+        response.close()
+
+
+    def test_conditional_get(self):
+        slide = self.client.post('/slides', json={'name':'Slide'}).get_json()
+
+        # Another write could follow within the same second. The write is
+        # moved ahead, without bookkeeping, so that the second cannot end
+        # before the requests.
+        self.db.conn.execute("UPDATE meta SET value = %f WHERE key = 'last_modification'" % (time.time() + 1))
+        response = self.client.get('/slides')
+        self.assertNotIn('Last-Modified', response.headers)
+        response = self.client.get('/slides', headers={'If-Modified-Since': http_date(time.time() + 1)})
+        self.assertEqual(response.status_code, 200)
+
+        # Make the write older, without bookkeeping
+        self.db.conn.execute("UPDATE meta SET value = value - 20 WHERE key = 'last_modification'")
+
+        for url in ['/beacons', '/slides', '/slides/%d' % slide['id']]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            last_modified = response.headers['Last-Modified']
+
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+            response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+            self.assertEqual(response.status_code, 304)
+
+        # Any write changes the ETag
+        self.client.patch('/slides/%d' % slide['id'], json={'name':'Renamed'})
+        response = self.client.get('/beacons', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()[0]['name'], 'Renamed')
+
+
+    def test_changes(self):
+        last = self.client.get('/beacons/changes').get_json()['last']
+
+        slide = self.client.post('/slides', json={'name':'Slide'}).get_json()
+        self.client.patch('/slides/%d' % slide['id'], json={'name':'Renamed'})
+
+        response = self.client.get('/beacons/changes?since=%d' % last).get_json()
+        self.assertEqual([c['operation'] for c in response['changes']], ['insert', 'update'])
+        self.assertEqual(response['changes'][1]['data'], {'name':'Renamed'})
+
+        response = self.client.get('/beacons/changes?since=%d' % response['last']).get_json()
+        self.assertEqual(response['changes'], [])
+
+        response = self.client.get('/beacons/changes?since=%d' % (response['last'] + 1))
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.get_json()['resync'])
+
+
+    def test_batch(self):
+        slide, row, column, box, bookmark = self.create_tree()
+
+        # Create
+        items = [{'name':'Bm%d' % i, 'parent_id':box['id'], 'url':'https://%d' % i} for i in range(3)]
+        response = self.client.post('/bookmarks', json=items)
+        self.assertEqual(response.status_code, 201)
+        results = response.get_json()
+        self.assertEqual([r['status'] for r in results], [201] * 3)
+        self.assertEqual([r['item']['position'] for r in results], [1, 2, 3])
+        self.assertEqual([r['item']['url'] for r in results], ['https://0', 'https://1', 'https://2'])
+        ids = [r['id'] for r in results]
+
+        # Invalid batches are rejected as a whole
+        response = self.client.post('/bookmarks', json=[{'name':'Valid', 'parent_id':box['id']}, {'name':'No parent'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.get_json()['message'])
+        self.assertEqual(len(self.db.select('bookmark')), 4)
+
+        # Patch
+        response = self.client.patch('/bookmarks', json=[
+            {'id':ids[2], 'position':0, 'name':'First'},
+            {'id':ids[0], 'url':'https://renamed'},
+            {'id':1000, 'name':'Missing'},
+        ])
+        results = response.get_json()
+        self.assertEqual([r['status'] for r in results], [200, 200, 404])
+        self.assertEqual(results[0]['item']['name'], 'First')
+        self.assertEqual(results[1]['item']['url'], 'https://renamed')
+        positions = [bm['id'] for bm in self.db.select('bookmark', _order_by='position', parent_id=box['id'])]
+        self.assertEqual(positions, [ids[2], bookmark['id'], ids[0], ids[1]])
+
+        # Delete
+        response = self.client.delete('/bookmarks', json=[ids[2], ids[0], 1000])
+        self.assertEqual([r['status'] for r in response.get_json()], [204, 204, 404])
+        items = self.db.select('bookmark', _order_by='position', parent_id=box['id'])
+        self.assertEqual([(bm['id'], bm['position']) for bm in items], [(bookmark['id'], 0), (ids[1], 1)])
+
+        # Booleans are not ids
+        self.assertEqual(self.client.delete('/bookmarks', json=[True]).status_code, 400)
+        self.assertEqual(self.client.patch('/bookmarks', json=[{'id':True, 'name':'Bool'}]).status_code, 400)
+        self.assertEqual(self.client.patch('/bookmarks', json=[{'id':1.5, 'name':'Float'}]).status_code, 400)
+        self.assertEqual(len(self.db.select('bookmark')), 2)
+        self.assertNotIn('Bool', [bm['name'] for bm in self.db.select('bookmark')])
+
+
+    def test_metrics(self):
+        # Disabled by default
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        metrics.registry.enabled = True
+        try:
+            self.client.get('/beacons')
+            response = self.client.get('/metrics')
+        finally:
+            metrics.registry.enabled = False
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'beacons_handler_duration_seconds_count{endpoint="beacons",method="GET"}', response.data)
+        self.assertIn(b'beacons_tree_cache_misses_total', response.data)
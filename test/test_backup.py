@@ -0,0 +1,89 @@
+import json
+import os
+import unittest
+from beacons_server import backup
+from beacons_server.db import DB, DatabaseBusyError, remove_database
+
+
+class BackupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB('test_backup.sqlite', create_tables=True, silent=True)
+        slide = self.db.insert_object('slide', {'name': 'Slide', 'position': 0})
+        row = self.db.insert_object('row', {'name': 'Row', 'parent_id': slide, 'position': 0, 'css': 'a {}'})
+        column = self.db.insert_object('column', {'name': 'Column', 'parent_id': row, 'position': 0})
+        box = self.db.insert_object('box', {'name': 'Box', 'parent_id': column, 'position': 0})
+        self.db.insert_objects('bookmark', [{'name': 'Bm %d' % i, 'url': 'u', 'parent_id': box, 'position': i}
+                                            for i in range(5)])
+
+
+    def tearDown(self):
+        self.db.close()
+        for path in ['test_backup.sqlite', 'test_backup_copy.sqlite', 'test_import.sqlite', 'test_export.ndjson']:
+            remove_database(path)
+
+
+    def test_export_lines(self):
+        items = [json.loads(line) for line in backup.export_lines(self.db)]
+        self.assertEqual([item['type'] for item in items], DB.OBJ_TYPES[:4] + ['bookmark'] * 5)
+        self.assertEqual(items[1], {'type': 'row', 'id': 1, 'parent_id': 1, 'position': 0, 'name': 'Row', 'css': 'a {}'})
+
+
+    def test_export_import(self):
+        with open('test_export.ndjson', 'wb') as file:
+            file.writelines(backup.export_lines(self.db))
+        self.assertEqual(backup.import_file('test_export.ndjson', 'test_import.sqlite'), 9)
+
+        db = DB('test_import.sqlite', silent=True)
+        for table in DB.OBJ_TYPES:
+            self.assertEqual(db.select(table, orderBy='id'), self.db.select(table, orderBy='id'))
+        self.assertEqual(len(db.search('Bm')), 5)
+        db.close()
+
+
+    def test_import_into_used_database(self):
+        with open('test_export.ndjson', 'wb') as file:
+            file.writelines(backup.export_lines(self.db))
+        self.db.set_pragmas({'journal_mode': 'WAL'})
+        self.db.insert_object('bookmark', {'name': 'Not checkpointed', 'parent_id': 1})
+        data_version = self.db.get_data_version()['data_version']
+
+        with self.assertRaises(DatabaseBusyError):
+            backup.import_file('test_export.ndjson', 'test_backup.sqlite')
+        self.assertEqual(len(self.db.select('bookmark')), 6)
+        self.assertFalse(os.path.exists('test_backup.sqlite.importing'))
+
+        # Once the server is stopped, the data version keeps increasing
+        self.db.close()
+        backup.import_file('test_export.ndjson', 'test_backup.sqlite')
+        self.db = DB('test_backup.sqlite', silent=True)
+        self.assertEqual(len(self.db.select('bookmark')), 5)
+        self.assertGreater(self.db.get_data_version()['data_version'], data_version)
+
+
+    def test_import_invalid_line(self):
+        db = DB('test_import.sqlite', create_tables=True, silent=True)
+        lines = list(backup.export_lines(self.db))
+        for invalid in [b'{"name": "Bm"}\n', b'not json\n', lines[0]]:
+            # The slide would be inserted twice
+            with self.assertRaises(ValueError):
+                backup.import_lines(db, lines + [invalid])
+            self.assertEqual(db.select('slide'), [])
+        db.close()
+
+
+    def test_snapshot(self):
+        backup.backup(self.db, 'test_backup_copy.sqlite')
+        copy = DB('test_backup_copy.sqlite', silent=True)
+        self.assertEqual(len(copy.select('bookmark')), 5)
+        copy.close()
+
+        snapshot = backup.Snapshot(self.db)
+        self.db.remove_item('bookmark', 1)
+        self.assertEqual(len(snapshot.db.select('bookmark')), 5)
+        snapshot.close()
+        self.assertFalse(os.path.exists(snapshot.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
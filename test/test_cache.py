@@ -0,0 +1,67 @@
+import unittest
+from beacons_server.cache import TreeCache
+
+
+class TreeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TreeCache(maxsize=2)
+        self.builds = 0
+
+
+    def build(self):
+        self.builds += 1
+        return [self.builds]
+
+
+    def test_get(self):
+        self.assertEqual(self.cache.get('a', self.build), [1])
+        self.assertEqual(self.cache.get('a', self.build), [1])
+        self.assertEqual(self.cache.get('b', self.build), [2])
+        self.assertEqual(self.builds, 2)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['size'], 2)
+
+
+    def test_maxsize(self):
+        self.cache.get('a', self.build)
+        self.cache.get('b', self.build)
+        self.cache.get('a', self.build)
+        # 'b' is the least recently used entry
+        self.cache.get('c', self.build)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(self.cache.get('a', self.build), [1])
+        self.assertEqual(self.cache.get('b', self.build), [4])
+
+
+    def test_clear(self):
+        self.cache.get('a', self.build)
+        self.cache.clear()
+        self.assertEqual(self.cache.get('a', self.build), [2])
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+
+    def test_clear_while_building(self):
+        def build():
+            self.cache.clear()
+            return self.build()
+
+        self.assertEqual(self.cache.get('a', build), [1])
+        # The value built before the invalidation is not stored
+        self.assertEqual(self.cache.get('a', self.build), [2])
+
+
+    def test_version(self):
+        self.cache.get((1, 'a'), self.build, 1)
+        self.cache.get((1, 'b'), self.build, 1)
+        # The entries of older versions are dropped
+        self.assertEqual(self.cache.get((2, 'a'), self.build, 2), [3])
+        self.assertEqual(self.cache.stats()['size'], 1)
+
+        # Values built for an older version are not stored
+        self.assertEqual(self.cache.get((1, 'a'), self.build, 1), [4])
+        self.assertEqual(self.cache.stats()['size'], 1)
+        self.assertEqual(self.cache.get((2, 'a'), self.build, 2), [3])
@@ -1,6 +1,8 @@
 import os
+import sqlite3
+import threading
 import unittest
-from beacons_server.db import DB
+from beacons_server.db import DB, DatabaseBusyError, SchemaUpgradeError, replace_database
 
 
 class DBTest(unittest.TestCase):
@@ -16,9 +18,11 @@ class DBTest(unittest.TestCase):
 
 
     def test_tables_exist(self):
-        sql = "SELECT name FROM sqlite_master WHERE type='table'"
+        # Ignore SQLite's tables and the search index's shadow tables
+        sql = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'search_%'"
         res = self.db.select_sql(sql)
-        self.assertEqual(len(res), 5)
+        self.assertEqual(len(res), 8)
+        self.assertEqual(set(table['name'] for table in res), set(DB.OBJ_TYPES + ['meta', 'change_log', 'search']))
 
 
     def test_insert_object(self):
@@ -40,6 +44,12 @@ class DBTest(unittest.TestCase):
         self.assertEqual(self.db.select('bookmark', unique=True, id=id3)['position'], 0)
         self.assertEqual(self.db.select('bookmark', unique=True, id=id4)['position'], 1)
 
+        # A None parent follows the whole table, as without parent
+        id5 = self.db.insert_object('bookmark', {'parent_id':None, 'position':None})
+        self.assertEqual(self.db.select('bookmark', unique=True, id=id5)['position'], 2)
+        ids = self.db.insert_objects('bookmark', [{'parent_id':None, 'position':None}, {'parent_id':1, 'position':None}])
+        self.assertEqual([bm['position'] for bm in self.db.select_ids('bookmark', ids)], [3, 2])
+
 
     def test_format_fields_values(self):
         self.assertEqual(self.db._format_fields_values(), '')
@@ -49,34 +59,6 @@ class DBTest(unittest.TestCase):
                          ['id = ?', 'name = ?'])
 
 
-    def test_get_sql_args(self):
-        # Test without argument
-        self.assertEqual(self.db._get_sql_args(), ({}, {}))
-
-        # Test with None value
-        self.assertEqual(self.db._get_sql_args(none_value=None), ({}, {}))
-
-        # Test with WHERE arguments using a dictionnary
-        self.assertEqual(self.db._get_sql_args({'id':1}), ({'id':1}, {}))
-        self.assertEqual(self.db._get_sql_args({'id':1,'name':'John'}), ({'id':1,'name':'John'}, {}))
-
-        # Test with SQL arguments using a dictionnary
-        self.assertEqual(self.db._get_sql_args({'_limit':5}), ({}, {'_limit':5}))
-        self.assertEqual(self.db._get_sql_args({'_order by':'id','_limit':5}), ({}, {'_limit':5, '_order by':'id'}))
-
-        # Test with WHERE + SQL arguments using a dictionnary
-        self.assertEqual(self.db._get_sql_args({'id':1, '_limit':5}), ({'id':1}, {'_limit':5}))
-
-        # Test with WHERE + SQL arguments using named arguments
-        self.assertEqual(self.db._get_sql_args(id=1, _limit=5), ({'id':1}, {'_limit':5}))
-
-        # Test with WHERE + SQL arguments using both a dictionnary and named arguments
-        self.assertEqual(self.db._get_sql_args(id=1, _limit=5, args={'name':'John', '_order by':'id'}), ({'id':1, 'name':'John'}, {'_limit':5, '_order by':'id'}))
-
-        # Test with WHERE + SQL arguments using both a dictionnary and named arguments with None values
-        self.assertEqual(self.db._get_sql_args(id=1, _limit=None, args={'name':None, '_order by':'id'}), ({'id':1}, {'_order by':'id'}))
-
-
     def test_format_and_condition(self):
         self.assertEqual(self.db._format_and_condition(), '')
         self.assertEqual(self.db._format_and_condition('id'), 'WHERE id = ?')
@@ -220,3 +202,447 @@ class DBTest(unittest.TestCase):
         self.assertIsNone(self.db._get_child_table('bookmark'))
         self.assertEqual(self.db._get_child_table('slide'), 'row')
         self.assertEqual(self.db._get_child_table('box'), 'bookmark')
+
+
+    def test_get_items_with_descendants(self):
+        slide = self.db.insert_object('slide', {'name':'Slide', 'position':0})
+        row = self.db.insert_object('row', {'name':'Row', 'position':0, 'parent_id':slide})
+        column = self.db.insert_object('column', {'name':'Col', 'position':0, 'parent_id':row})
+        box1 = self.db.insert_object('box', {'name':'Box1', 'position':1, 'parent_id':column})
+        box2 = self.db.insert_object('box', {'name':'Box2', 'position':0, 'parent_id':column})
+        bm1 = self.db.insert_object('bookmark', {'name':'Bm1', 'position':1, 'parent_id':box1})
+        bm2 = self.db.insert_object('bookmark', {'name':'Bm2', 'position':0, 'parent_id':box1})
+        empty_slide = self.db.insert_object('slide', {'name':'Empty', 'position':1})
+
+        slides = self.db.get_items_with_descendants('slide')
+        self.assertEqual([s['id'] for s in slides], [slide, empty_slide])
+        self.assertEqual(slides[1]['content'], [])
+
+        boxes = slides[0]['content'][0]['content'][0]['content']
+        self.assertEqual([b['id'] for b in boxes], [box2, box1])
+        self.assertEqual(boxes[0]['content'], [])
+        self.assertEqual([bm['id'] for bm in boxes[1]['content']], [bm2, bm1])
+        self.assertNotIn('content', boxes[1]['content'][0])
+
+        # Stop at the given level
+        slides = self.db.get_items_with_descendants('slide', until='row')
+        self.assertNotIn('content', slides[0]['content'][0])
+
+        # Start from a given parent
+        boxes = self.db.get_items_with_descendants('box', parent_id=column)
+        self.assertEqual([b['id'] for b in boxes], [box2, box1])
+        self.assertEqual(len(boxes[1]['content']), 2)
+
+        # Start from a given item, down to a given depth
+        item = self.db.get_item_with_descendants('row', row)
+        self.assertEqual(item['content'][0]['content'][1]['content'][0]['id'], bm2)
+        item = self.db.get_item_with_descendants('row', row, depth=2)
+        self.assertEqual([b['id'] for b in item['content'][0]['content']], [box2, box1])
+        self.assertNotIn('content', item['content'][0]['content'][0])
+        self.assertNotIn('content', self.db.get_item_with_descendants('row', row, depth=0))
+        self.assertIsNone(self.db.get_item_with_descendants('row', 999))
+
+
+    def test_transaction(self):
+        other = DB('test_db.sqlite', silent=True)
+
+        # Commit is deferred to the end of the block
+        with self.db.transaction():
+            self.db.insert_object('bookmark', {'name':'Joh'})
+            with self.db.transaction():
+                self.db.insert_object('bookmark', {'name':'Doe'})
+            self.assertEqual(other.select('bookmark'), [])
+        self.assertEqual(len(other.select('bookmark')), 2)
+
+        # Rolled back on exception
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.db.insert_object('bookmark', {'name':'Bob'})
+                raise ValueError()
+        self.assertEqual(len(self.db.select('bookmark')), 2)
+
+        # Rolled back on SQL error, which is raised by the outermost block
+        # even if the writes which follow it succeeded
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.db.transaction():
+                self.db.insert_object('bookmark', {'name':'Foo'})
+                self.db.insert_object('bookmark', {'inexistentTable':'Foo'})
+                self.assertIsNotNone(self.db.insert_object('bookmark', {'name':'Bar'}))
+        self.assertEqual(len(self.db.select('bookmark')), 2)
+
+        # Requests executed outside of a block still return None
+        self.assertIsNone(self.db.execute_sql('INSERT INTO nope VALUES (1)'))
+        self.assertIsNone(self.db.insert_object('bookmark', {'inexistentTable':'Foo'}))
+        other.close()
+
+
+    def test_transaction_commit_failure(self):
+        # Deferred constraints are only checked by the commit
+        self.db.conn.execute('PRAGMA foreign_keys = ON')
+        self.db.execute_sql('CREATE TABLE child (slide_id REFERENCES slide(id) DEFERRABLE INITIALLY DEFERRED)')
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.db.transaction():
+                self.db.insert_object('bookmark', {'name':'Joh'})
+                self.db.execute_sql('INSERT INTO child (slide_id) VALUES (999)')
+        self.assertEqual(self.db.select('bookmark'), [])
+
+        # The handle can still be used
+        self.db.insert_object('bookmark', {'name':'Doe'})
+        self.assertEqual(len(self.db.select('bookmark')), 1)
+
+
+    def assertPositionsContiguous(self, table, parent_id):
+        items = self.db.select(table, _order_by='position', parent_id=parent_id)
+        self.assertEqual([item['position'] for item in items], list(range(len(items))))
+        return [item['id'] for item in items]
+
+
+    def test_move_item(self):
+        ids = [self.db.insert_object('bookmark', {'position':None, 'parent_id':1}) for i in range(5)]
+        other_ids = [self.db.insert_object('bookmark', {'position':None, 'parent_id':2}) for i in range(3)]
+
+        # Move up within the same parent
+        self.db.move_item('bookmark', ids[3], 0)
+        self.assertEqual(self.assertPositionsContiguous('bookmark', 1), [ids[3], ids[0], ids[1], ids[2], ids[4]])
+
+        # Move down within the same parent
+        self.db.move_item('bookmark', ids[3], 3)
+        self.assertEqual(self.assertPositionsContiguous('bookmark', 1), ids)
+
+        # Move to another parent
+        self.db.move_item('bookmark', ids[1], 1, parent_id=2)
+        self.assertEqual(self.assertPositionsContiguous('bookmark', 1), [ids[0], ids[2], ids[3], ids[4]])
+        self.assertEqual(self.assertPositionsContiguous('bookmark', 2), [other_ids[0], ids[1], other_ids[1], other_ids[2]])
+
+        # Delete
+        self.db.remove_item('bookmark', other_ids[0])
+        self.assertEqual(self.assertPositionsContiguous('bookmark', 2), [ids[1], other_ids[1], other_ids[2]])
+
+
+    def test_schema_version(self):
+        self.assertEqual(self.db.get_schema_version(), DB.SCHEMA_VERSION)
+
+        sql = "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='bookmark'"
+        self.assertIn('bookmark_parent_position', [index['name'] for index in self.db.select_sql(sql)])
+
+        sql = 'EXPLAIN QUERY PLAN SELECT * FROM bookmark WHERE parent_id = 1 ORDER BY position'
+        self.assertIn('bookmark_parent_position', self.db.select_sql(sql, unique=True)['detail'])
+
+
+    def test_upgrade_schema(self):
+        # Simulate a database created before the schema versioning
+        self.db.execute_sql('DROP INDEX bookmark_parent_position')
+        self.db.execute_sql('PRAGMA user_version = 0')
+        self.db.insert_object('bookmark', {'name':'Joh'})
+
+        self.assertEqual(self.db.upgrade_schema(), DB.SCHEMA_VERSION)
+        self.assertEqual(self.db.get_schema_version(), DB.SCHEMA_VERSION)
+        sql = "SELECT name FROM sqlite_master WHERE name='bookmark_parent_position'"
+        self.assertIsNotNone(self.db.select_sql(sql, unique=True))
+        self.assertEqual(len(self.db.select('bookmark')), 1)
+
+
+    def test_concurrent_upgrade_schema(self):
+        # The schema was upgraded by another process after this one read
+        # its version, before it took the write lock
+        self.db.insert_object('bookmark', {'name':'Joh'})
+        versions = iter([0])
+        self.db.get_schema_version = lambda: next(versions, DB.get_schema_version(self.db))
+        data_version = self.db.get_data_version()
+
+        self.assertEqual(self.db.upgrade_schema(), DB.SCHEMA_VERSION)
+        # No upgrade was applied again: the search index was not rebuilt
+        self.assertEqual(self.db.get_data_version(), data_version)
+
+
+    def test_upgrade_schema_failure(self):
+        self.db.execute_sql('DROP INDEX bookmark_parent_position')
+        self.db.execute_sql('PRAGMA user_version = 0')
+        self.db.SCHEMA_UPGRADES = DB.SCHEMA_UPGRADES[:1] + [['CREATE TABLE malformed (']]
+
+        with self.assertRaises(SchemaUpgradeError):
+            self.db.upgrade_schema()
+        # Every upgrade is rolled back
+        self.assertEqual(self.db.get_schema_version(), 0)
+        sql = "SELECT name FROM sqlite_master WHERE name='bookmark_parent_position'"
+        self.assertIsNone(self.db.select_sql(sql, unique=True))
+
+
+    def test_replace_database(self):
+        other = DB('test_db_other.sqlite', create_tables=True, silent=True)
+        other.insert_object('bookmark', {'name':'Joh'})
+        other.close()
+        for i in range(3):
+            self.db.insert_object('bookmark', {'name':'Doe'})
+        data_version = self.db.get_data_version()['data_version']
+
+        # Refused while the database is used by another connection
+        self.db.set_pragmas({'journal_mode': 'WAL'})
+        self.assertEqual(len(self.db.select('bookmark')), 3)
+        with self.assertRaises(DatabaseBusyError):
+            replace_database('test_db_other.sqlite', 'test_db.sqlite')
+        self.assertTrue(os.path.exists('test_db_other.sqlite'))
+        self.assertEqual(len(self.db.select('bookmark')), 3)
+
+        self.db.close()
+        with open('test_db.sqlite-shm', 'wb') as file:
+            file.write(b'stale')
+
+        replace_database('test_db_other.sqlite', 'test_db.sqlite')
+        self.assertFalse(os.path.exists('test_db_other.sqlite'))
+        self.assertFalse(os.path.exists('test_db.sqlite-shm'))
+        self.db = DB('test_db.sqlite', silent=True)
+        self.assertEqual(self.db.select('bookmark', unique=True)['name'], 'Joh')
+        # ETags of the replaced database do not match the new one
+        self.assertGreater(self.db.get_data_version()['data_version'], data_version)
+
+
+    def test_search(self):
+        slide = self.db.insert_object('slide', {'name':'Slide'})
+        row = self.db.insert_object('row', {'name':'Row', 'parent_id':slide})
+        column = self.db.insert_object('column', {'name':'Column', 'parent_id':row})
+        box = self.db.insert_object('box', {'name':'Python docs', 'parent_id':column})
+        bm1 = self.db.insert_object('bookmark', {'name':'Tutorial', 'url':'https://docs.python.org/tutorial', 'parent_id':box, 'position':None})
+        bm2 = self.db.insert_object('bookmark', {'name':'Python éléments', 'url':'https://example.com', 'parent_id':box, 'position':None})
+
+        # Prefix matching, names ranking higher than urls
+        results = self.db.search('pyth')
+        self.assertEqual([(r['type'], r['id']) for r in results], [('box', box), ('bookmark', bm2), ('bookmark', bm1)])
+        self.assertEqual(results[1]['item']['url'], 'https://example.com')
+        self.assertEqual([(p['type'], p['id']) for p in results[1]['path']],
+                         [('slide', slide), ('row', row), ('column', column), ('box', box)])
+        self.assertEqual(results[1]['path'][-1]['name'], 'Python docs')
+
+        # Every word must match, regardless of diacritics and punctuation
+        self.assertEqual([r['id'] for r in self.db.search('elem "python')], [bm2])
+        self.assertEqual([r['id'] for r in self.db.search('docs.python')], [box, bm1])
+        self.assertEqual(self.db.search('python missing'), [])
+        self.assertEqual(self.db.search(' - '), [])
+        self.assertEqual(len(self.db.search('python', limit=1)), 1)
+
+        # The index follows the updates and deletions
+        self.db.update_item('bookmark', bm1, name='Guide')
+        self.assertEqual([r['id'] for r in self.db.search('guide')], [bm1])
+        self.assertEqual([r['id'] for r in self.db.search('tutorial')], [bm1])
+        self.db.update_item('bookmark', bm1, url='https://example.org')
+        self.assertEqual(self.db.search('tutorial'), [])
+        self.db.remove_item('bookmark', bm2)
+        self.assertEqual([r['id'] for r in self.db.search('python')], [box])
+
+
+    def test_data_version(self):
+        version = self.db.get_data_version()['data_version']
+
+        # Reading does not change the data version
+        self.db.select('bookmark')
+        self.assertEqual(self.db.get_data_version()['data_version'], version)
+
+        id = self.db.insert_object('bookmark', {'name':'Joh', 'position':None})
+        self.assertEqual(self.db.get_data_version()['data_version'], version + 1)
+
+        # A transaction increments the data version only once
+        with self.db.transaction():
+            self.db.update_item('bookmark', id, name='Doe')
+            self.db.update_item('bookmark', id, position=3)
+        data_version = self.db.get_data_version()
+        self.assertEqual(data_version['data_version'], version + 2)
+
+        # Rolled back writes do not change it either
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.db.transaction():
+                self.db.update_item('bookmark', id, name='Bob')
+                self.db.update_item('bookmark', id, inexistentField='Bob')
+        self.assertEqual(self.db.get_data_version(), data_version)
+
+
+    def test_get_changes(self):
+        self.assertEqual(self.db.get_last_change_seq(), 0)
+        self.assertEqual(self.db.get_changes(0), [])
+
+        id1 = self.db.insert_object('bookmark', {'name':'Joh', 'position':None, 'parent_id':1})
+        id2 = self.db.insert_object('bookmark', {'name':'Doe', 'position':None, 'parent_id':1})
+        self.db.update_item('bookmark', id1, name='Bob')
+        self.db.move_item('bookmark', id2, 0)
+        self.db.remove_item('bookmark', id1)
+
+        changes = self.db.get_changes(0)
+        self.assertEqual([(c['operation'], c['item_id']) for c in changes], [
+            ('insert', id1), ('insert', id2),
+            ('update', id1),
+            ('shift', None), ('update', id2),
+            ('delete', id1),
+        ])
+        self.assertEqual(changes[1]['data'], {'name':'Doe', 'position':1, 'parent_id':1})
+        self.assertEqual(changes[3]['data'], {'parent_id':1, 'min_position':0, 'max_position':0, 'amount':1})
+
+        last = self.db.get_last_change_seq()
+        self.assertEqual(changes[-1]['seq'], last)
+        self.assertEqual(self.db.get_changes(last), [])
+        self.assertEqual(len(self.db.get_changes(last - 2)), 2)
+        self.assertIsNone(self.db.get_changes(last + 1))
+
+        # Removing an inexistent item is not recorded
+        self.db.remove_item('bookmark', id1)
+        self.assertEqual(self.db.get_last_change_seq(), last)
+
+
+    def test_compact_change_log(self):
+        self.db.CHANGE_LOG_SIZE = 2
+        id = self.db.insert_object('bookmark', {'name':'Joh'})
+        for name in ['Doe', 'Bob', 'Foo']:
+            self.db.update_item('bookmark', id, name=name)
+
+        last = self.db.get_last_change_seq()
+        self.assertEqual(len(self.db.get_changes(last - 2)), 2)
+        self.assertIsNone(self.db.get_changes(last - 3))
+
+
+    def test_insert_objects(self):
+        self.db.insert_object('bookmark', {'name':'Joh', 'position':None, 'parent_id':1})
+        ids = self.db.insert_objects('bookmark', [
+            {'name':'Doe', 'position':None, 'parent_id':1},
+            {'name':'Bob', 'position':None, 'parent_id':2},
+            {'name':'Foo', 'position':5, 'parent_id':2},
+            {'name':'Olf', 'position':None, 'parent_id':1},
+        ])
+        items = self.db.select_ids('bookmark', ids)
+        self.assertEqual([item['id'] for item in items], ids)
+        self.assertEqual([(item['name'], item['position']) for item in items],
+                         [('Doe', 1), ('Bob', 0), ('Foo', 5), ('Olf', 2)])
+        self.assertEqual(self.db.insert_objects('bookmark', []), [])
+        self.assertIsNone(self.db.insert_objects('bookmark', [{'inexistentField':'Joh'}]))
+
+
+    def test_concurrent_generated_positions(self):
+        nb_threads, nb_inserts = 8, 20
+        failures = []
+
+        def insert(index):
+            db = DB('test_db.sqlite', silent=True)
+            for i in range(nb_inserts):
+                if i % 4 == 0:
+                    ids = db.insert_objects('bookmark', [{'position':None, 'parent_id':1}] * 2)
+                else:
+                    ids = db.insert_object('bookmark', {'position':None, 'parent_id':1})
+                if ids is None:
+                    failures.append(index)
+            db.close()
+
+        threads = [threading.Thread(target=insert, args=(i,)) for i in range(nb_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        items = self.db.select('bookmark', _order_by='position', parent_id=1)
+        self.assertEqual(len(items), nb_threads * nb_inserts * 5 // 4)
+        self.assertEqual([item['position'] for item in items], list(range(len(items))))
+
+
+    def test_concurrent_moves(self):
+        ids = [self.db.insert_object('bookmark', {'position':None, 'parent_id':1}) for i in range(10)]
+        nb_threads, nb_moves = 8, 20
+
+        def move(index):
+            db = DB('test_db.sqlite', silent=True)
+            for i in range(nb_moves):
+                db.move_item('bookmark', ids[(index + i) % len(ids)], (index * i) % len(ids), parent_id=1)
+            db.close()
+
+        threads = [threading.Thread(target=move, args=(i,)) for i in range(nb_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(self.assertPositionsContiguous('bookmark', 1)), ids)
+
+
+    def test_busy(self):
+        settings = DB.BUSY_TIMEOUT, DB.BUSY_RETRIES, DB.BUSY_BACKOFF
+        DB.BUSY_TIMEOUT, DB.BUSY_RETRIES, DB.BUSY_BACKOFF = 0.01, 2, 0.01
+        db = DB('test_db.sqlite', silent=True)
+        other = sqlite3.connect('test_db.sqlite', isolation_level=None, check_same_thread=False)
+        try:
+            # Fail once the retries are exhausted, releasing the write lock
+            other.execute('BEGIN IMMEDIATE')
+            with self.assertRaises(DatabaseBusyError):
+                db.insert_object('bookmark', {'name':'Joh'})
+            with self.assertRaises(DatabaseBusyError):
+                with db.transaction():
+                    pass
+            self.assertEqual(db._transaction_depth, 0)
+
+            # Succeed once the other writer is done
+            timer = threading.Timer(0.015, other.commit)
+            timer.start()
+            DB.BUSY_RETRIES = 10
+            self.assertIsNotNone(db.insert_object('bookmark', {'name':'Joh'}))
+            timer.join()
+        finally:
+            DB.BUSY_TIMEOUT, DB.BUSY_RETRIES, DB.BUSY_BACKOFF = settings
+            other.close()
+            db.close()
+
+
+    def test_is_read_only(self):
+        self.assertTrue(DB._is_read_only('SELECT * FROM bookmark'))
+        self.assertTrue(DB._is_read_only('  select 1'))
+        self.assertTrue(DB._is_read_only('PRAGMA user_version'))
+        self.assertFalse(DB._is_read_only('PRAGMA user_version = 3'))
+        self.assertFalse(DB._is_read_only('INSERT INTO bookmark DEFAULT VALUES'))
+        self.assertFalse(DB._is_read_only('CREATE TABLE t (id integer)'))
+
+
+    def test_select_order_by(self):
+        first = self.db.insert_object('bookmark', {'name':'Joh', 'position':1})
+        second = self.db.insert_object('bookmark', {'name':'Doe', 'position':0})
+        self.assertEqual([item['id'] for item in self.db.select('bookmark', orderBy='position')], [second, first])
+        self.assertEqual([item['id'] for item in self.db.select('bookmark', orderBy='position', _order_by='name')], [second, first])
+        self.assertEqual([item['id'] for item in self.db.select('bookmark', orderBy='name DESC', _order_by=None)], [first, second])
+
+
+    def test_select_page(self):
+        ids = self.db.insert_objects('bookmark', [{'name':'Bm %d' % i, 'parent_id':i % 2} for i in range(5)])
+
+        items, next = self.db.select_page('bookmark', limit=2)
+        self.assertEqual([item['id'] for item in items], ids[:2])
+        self.assertEqual(next, ids[1])
+        items, next = self.db.select_page('bookmark', after=next, limit=2)
+        self.assertEqual([item['id'] for item in items], ids[2:4])
+        items, next = self.db.select_page('bookmark', after=next, limit=2)
+        self.assertEqual([item['id'] for item in items], ids[4:])
+        self.assertIsNone(next)
+
+        # Last page holding exactly 'limit' items
+        items, next = self.db.select_page('bookmark', after=ids[2], limit=2)
+        self.assertEqual(len(items), 2)
+        self.assertIsNone(next)
+
+        # Filters and projection
+        items, next = self.db.select_page('bookmark', fields=['name'], parent_id=1)
+        self.assertEqual(items, [{'id':ids[1], 'name':'Bm 1'}, {'id':ids[3], 'name':'Bm 3'}])
+        self.assertIsNone(next)
+
+
+    def test_statement_cache(self):
+        self.db.insert_object('bookmark', {'name':'Joh', 'position':1})
+        DB._select_statement.cache_clear()
+
+        self.db.select('bookmark', _order_by='position', name='Joh')
+        self.db.select('bookmark', _order_by='position', name='Doe')
+        info = DB._select_statement.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+        self.assertEqual(DB._select_statement('bookmark', ('name', 'id'), (('_order_by', ('position', 'id')), ('_limit', 5))),
+                         'SELECT * FROM bookmark WHERE name = ? AND id = ? ORDER BY position, id LIMIT 5')
+        self.assertEqual(len(self.db.select('bookmark', _order_by=['position', 'id'])), 1)
+        self.assertEqual(len(self.db.select('bookmark', _order_by='position desc, id')), 1)
+
+        # Commands are put as is in the request, they must be columns
+        with self.assertRaises(ValueError):
+            self.db.select('bookmark', _order_by='id; DROP TABLE bookmark')
+        with self.assertRaises(ValueError):
+            self.db.select('bookmark', _group_by='(SELECT 1)')
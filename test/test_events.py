@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+import unittest
+from beacons_server.db import DB
+from beacons_server.events import EventBroker, TooManySubscribers
+
+
+class EventBrokerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = EventBroker(heartbeat=0.05)
+
+
+    def test_heartbeat(self):
+        stream = self.broker.subscribe()
+        self.assertEqual(next(stream), 'retry: %d\n\n' % EventBroker.RETRY)
+        self.assertEqual(next(stream), ': heartbeat\n\n')
+        self.assertEqual(self.broker.subscribers, 1)
+        stream.close()
+        self.assertEqual(self.broker.subscribers, 0)
+
+
+    def test_publish(self):
+        streams = [self.broker.subscribe() for i in range(3)]
+        for stream in streams:
+            next(stream)
+
+        messages = []
+        def read(stream):
+            messages.append(next(stream))
+        self.broker.heartbeat = 5
+        threads = [threading.Thread(target=read, args=(stream,)) for stream in streams]
+        for thread in threads:
+            thread.start()
+        self.broker.publish(3)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(messages, ['id: 3\nevent: change\ndata: {"data_version": 3}\n\n'] * 3)
+
+        # Older versions are ignored
+        self.broker.publish(2)
+        self.assertEqual(self.broker.version, 3)
+
+
+    def test_last_event_id(self):
+        self.broker.publish(3)
+
+        # Up to date client
+        stream = self.broker.subscribe('3')
+        next(stream)
+        self.assertEqual(next(stream), ': heartbeat\n\n')
+
+        # Client reconnecting after missing a change
+        stream = self.broker.subscribe('2')
+        next(stream)
+        self.assertTrue(next(stream).startswith('id: 3\n'))
+
+
+    def test_max_subscribers(self):
+        self.broker.max_subscribers = 2
+        streams = [self.broker.subscribe() for i in range(2)]
+        with self.assertRaises(TooManySubscribers):
+            self.broker.subscribe()
+
+        # Slots are released by closing the streams, even if never read
+        streams[0].close()
+        streams[0].close()
+        self.assertEqual(self.broker.subscribers, 1)
+        self.broker.subscribe().close()
+        streams[1].close()
+        self.assertEqual(self.broker.subscribers, 0)
+
+
+    def test_watch(self):
+        reads = []
+        def read_version():
+            reads.append(len(reads) + 1)
+            return reads[-1]
+
+        self.broker.watch(read_version, interval=0.01)
+        time.sleep(0.05)
+        # Nothing is read without subscribers
+        self.assertEqual(reads, [])
+
+        stream = self.broker.subscribe('0')
+        next(stream)
+        self.assertTrue(next(stream).startswith('id: '))
+        stream.close()
+        self.assertGreater(self.broker.version, 0)
+
+
+    def test_db_commit_listener(self):
+        versions = []
+        db = DB('test_events.sqlite', create_tables=True, silent=True)
+        DB.COMMIT_LISTENERS.append(versions.append)
+        try:
+            db.insert_object('bookmark', {'name':'Joh'})
+            db.select('bookmark')
+            with db.transaction():
+                db.insert_object('bookmark', {'name':'Doe'})
+                db.insert_object('bookmark', {'name':'Bob'})
+            self.assertEqual(versions, [2, 3])
+        finally:
+            DB.COMMIT_LISTENERS.remove(versions.append)
+            db.close()
+            os.remove('test_events.sqlite')
@@ -0,0 +1,70 @@
+import logging
+import os
+import unittest
+from beacons_server.db import DB
+from beacons_server.log import SamplingFilter, setup_logging, stop_listener
+
+
+class RecordsHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB('test_log.sqlite', create_tables=True, silent=True)
+
+
+    def tearDown(self):
+        DB.SLOW_QUERY_THRESHOLD = None
+        self.db.close()
+        os.remove('test_log.sqlite')
+
+
+    def test_sampling_filter(self):
+        debug = logging.LogRecord('sql', logging.DEBUG, '', 0, 'SELECT', (), None)
+        warning = logging.LogRecord('sql', logging.WARNING, '', 0, 'SELECT', (), None)
+
+        self.assertFalse(SamplingFilter(0).filter(debug))
+        self.assertTrue(SamplingFilter(0).filter(warning))
+        self.assertTrue(SamplingFilter(1).filter(debug))
+
+
+    def test_sql_logging(self):
+        self.db.SILENT = False
+        with self.assertLogs('beacons_server.sql', level='DEBUG') as logs:
+            self.db.select('bookmark', id=1)
+        self.assertEqual(logs.output, ['DEBUG:beacons_server.sql:SELECT * FROM bookmark WHERE id = ?  -- (1,)'])
+
+        with self.assertLogs('beacons_server.db', level='ERROR'):
+            self.db.select('inexistentTable')
+
+
+    def test_slow_query(self):
+        DB.SLOW_QUERY_THRESHOLD = 0
+        with self.assertLogs('beacons_server.sql.slow', level='WARNING') as logs:
+            self.db.select('bookmark')
+        self.assertIn('SELECT * FROM bookmark', logs.output[0])
+
+
+    def test_setup_logging(self):
+        handler = RecordsHandler()
+        root = logging.getLogger('beacons_server')
+        sql_logger = logging.getLogger('beacons_server.sql')
+        listener = setup_logging(sql_level=logging.DEBUG, handler=handler)
+        try:
+            self.db.SILENT = False
+            self.db.select('bookmark', id=1)
+        finally:
+            stop_listener(listener)
+            root.handlers, root.propagate = [], True
+            root.setLevel(logging.NOTSET)
+            sql_logger.setLevel(logging.NOTSET)
+        self.assertEqual(handler.messages, ['SELECT * FROM bookmark WHERE id = ?  -- (1,)'])
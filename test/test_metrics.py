@@ -0,0 +1,73 @@
+import os
+import unittest
+from beacons_server import metrics
+from beacons_server.db import DB
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry(enabled=True)
+        self.enabled = metrics.registry.enabled
+
+
+    def tearDown(self):
+        metrics.registry.enabled = self.enabled
+
+
+    def test_counter(self):
+        counter = self.registry.counter('requests_total', 'Requests.', ('table',))
+        counter.inc(('bookmark',))
+        counter.inc(('bookmark',), 2)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{table="bookmark"} 3',
+        ]) + '\n')
+
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('duration_seconds', 'Durations.', buckets=(0.1, 1))
+        for value in [0.05, 0.5, 0.5, 5]:
+            histogram.observe(value)
+        self.assertEqual(self.registry.render().split('\n')[2:7], [
+            'duration_seconds_bucket{le="0.1"} 1',
+            'duration_seconds_bucket{le="1"} 3',
+            'duration_seconds_bucket{le="+Inf"} 4',
+            'duration_seconds_sum 6.05',
+            'duration_seconds_count 4',
+        ])
+
+
+    def test_collector(self):
+        self.registry.add_collector(lambda: [('subscribers', 'gauge', 'Subscribers.', 2)])
+        self.assertIn('subscribers 2\n', self.registry.render())
+
+
+    def test_sql_labels(self):
+        self.assertEqual(metrics.sql_labels('SELECT * FROM bookmark WHERE id = ?'), ('SELECT', 'bookmark'))
+        self.assertEqual(metrics.sql_labels('INSERT INTO box (name) VALUES (?)'), ('INSERT', 'box'))
+        self.assertEqual(metrics.sql_labels('UPDATE row SET position = position + ?'), ('UPDATE', 'row'))
+        self.assertEqual(metrics.sql_labels('PRAGMA user_version'), ('PRAGMA', ''))
+        self.assertEqual(metrics.sql_labels('CREATE TABLE IF NOT EXISTS meta (key text)'), ('CREATE', 'meta'))
+        self.assertEqual(metrics.sql_labels('DROP TABLE IF EXISTS search'), ('DROP', 'search'))
+
+
+    def test_db_metrics(self):
+        db = DB('test_metrics.sqlite', create_tables=True, silent=True)
+        keys = [('SELECT', 'bookmark'), ('INSERT', 'bookmark')]
+        requests = [metrics.sql_requests._values.get(key, 0) for key in keys]
+        rows = [metrics.sql_rows._values.get(key, 0) for key in keys]
+        try:
+            metrics.registry.enabled = True
+            db.insert_object('bookmark', {'name':'Joh'})
+            db.select('bookmark')
+            metrics.registry.enabled = False
+            # Nothing is recorded while disabled
+            db.select('bookmark')
+        finally:
+            db.close()
+            os.remove('test_metrics.sqlite')
+
+        self.assertEqual([metrics.sql_requests._values[key] for key in keys], [requests[0] + 1, requests[1] + 1])
+        self.assertEqual([metrics.sql_rows._values[key] for key in keys], [rows[0] + 1, rows[1] + 1])
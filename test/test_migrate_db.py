@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+import migrate_db
+from beacons_server.db import DB
+
+LEGACY_SCHEMA = """
+CREATE TABLE slide (id integer PRIMARY KEY, title text, position integer, css text);
+CREATE TABLE row (id integer PRIMARY KEY, title text, css text);
+CREATE TABLE column (id integer PRIMARY KEY, title text);
+CREATE TABLE box (id integer PRIMARY KEY, title text);
+CREATE TABLE bookmark (id integer PRIMARY KEY, title text, url text, icon text);
+CREATE TABLE slide_row (slide_id integer, row_id integer, position integer);
+CREATE TABLE row_column (row_id integer, column_id integer, position integer);
+CREATE TABLE column_box (column_id integer, box_id integer, position integer);
+CREATE TABLE box_bookmark (box_id integer, bookmark_id integer, position integer);
+"""
+
+
+class MigrateDBTest(unittest.TestCase):
+
+    def setUp(self):
+        conn = sqlite3.connect('test_legacy.db')
+        conn.executescript(LEGACY_SCHEMA)
+        conn.execute("INSERT INTO slide VALUES (3, 'Slide', 0, 'a {}')")
+        conn.execute("INSERT INTO row VALUES (5, 'Row', 'b {}')")
+        conn.execute("INSERT INTO row VALUES (6, 'Orphan', NULL)")
+        conn.execute("INSERT INTO column VALUES (7, 'Column')")
+        conn.execute("INSERT INTO box VALUES (8, 'Box')")
+        conn.executemany("INSERT INTO bookmark VALUES (?, ?, 'https://example.com', NULL)",
+                         [(i, 'Bookmark %d' % i) for i in range(10, 20)])
+        conn.execute('INSERT INTO slide_row VALUES (3, 5, 0)')
+        conn.execute('INSERT INTO slide_row VALUES (4, 6, 1)')
+        conn.execute('INSERT INTO row_column VALUES (5, 7, 0)')
+        conn.execute('INSERT INTO column_box VALUES (7, 8, 0)')
+        conn.executemany('INSERT INTO box_bookmark VALUES (8, ?, ?)', [(i, 19 - i) for i in range(10, 20)])
+        conn.commit()
+        conn.close()
+
+
+    def tearDown(self):
+        for path in ['test_legacy.db', 'test_migrated.sqlite', 'test_migrated.sqlite.migrating']:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def migrate(self, **kwargs):
+        with redirect_stdout(StringIO()):
+            migrate_db.migrate('test_legacy.db', 'test_migrated.sqlite', **kwargs)
+        return DB('test_migrated.sqlite', silent=True)
+
+
+    def test_migrate(self):
+        db = self.migrate(chunk_size=3)
+        self.assertEqual(db.select('slide'), [{'id': 3, 'position': 0, 'name': 'Slide'}])
+        # The orphan row is skipped
+        self.assertEqual(db.select('row'), [{'id': 5, 'parent_id': 3, 'position': 0, 'name': 'Row', 'css': 'b {}'}])
+        self.assertEqual(db.select('box', unique=True, id=8)['parent_id'], 7)
+
+        bookmarks = db.select('bookmark', orderBy='position')
+        self.assertEqual([bookmark['id'] for bookmark in bookmarks], list(range(19, 9, -1)))
+        self.assertEqual(bookmarks[0]['name'], 'Bookmark 19')
+        self.assertEqual(db.search('Bookmark')[0]['type'], 'bookmark')
+        self.assertFalse(os.path.exists('test_migrated.sqlite.migrating'))
+        db.close()
+
+
+    def test_resume(self):
+        # Migration interrupted after the slides and rows
+        db = DB('test_migrated.sqlite.migrating', create_tables=True, silent=True)
+        db.execute_sql("INSERT INTO slide (id, position, name) VALUES (3, 0, 'Migrated')")
+        db.execute_sql("INSERT INTO row (id, parent_id, position, name) VALUES (5, 3, 0, 'Migrated')")
+        db.execute_sql('INSERT INTO meta (key, value) VALUES (?, 2)', (migrate_db.PROGRESS_KEY,))
+        db.close()
+
+        db = self.migrate()
+        self.assertEqual(db.select('slide', unique=True)['name'], 'Migrated')
+        self.assertEqual(db.select('row', unique=True)['name'], 'Migrated')
+        self.assertEqual(len(db.select('bookmark')), 10)
+        self.assertIsNone(db.select('meta', unique=True, key=migrate_db.PROGRESS_KEY))
+        db.close()
+
+        db = self.migrate(restart=True)
+        self.assertEqual(db.select('slide', unique=True)['name'], 'Slide')
+        db.close()
+
+
+    def test_target_in_use(self):
+        server = DB('test_migrated.sqlite', create_tables=True, silent=True, pragmas={'journal_mode': 'WAL'})
+        for i in range(3):
+            server.insert_object('slide', {'name': 'Served'})
+        data_version = server.get_data_version()['data_version']
+
+        with self.assertRaises(SystemExit):
+            self.migrate()
+        self.assertEqual(len(server.select('slide')), 3)
+        server.close()
+
+        # The next run only replaces the database
+        db = self.migrate()
+        self.assertEqual(db.select('slide', unique=True)['name'], 'Slide')
+        self.assertEqual(len(db.select('bookmark')), 10)
+        self.assertIsNone(db.select('meta', unique=True, key=migrate_db.PROGRESS_KEY))
+        self.assertGreater(db.get_data_version()['data_version'], data_version)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
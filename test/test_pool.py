@@ -0,0 +1,49 @@
+import os
+import unittest
+from beacons_server.pool import ConnectionPool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool('test_pool.sqlite', size=2, silent=True,
+                                   pragmas={'journal_mode': 'WAL', 'cache_size': -4000})
+
+
+    def tearDown(self):
+        self.pool.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists('test_pool.sqlite' + suffix):
+                os.remove('test_pool.sqlite' + suffix)
+
+
+    def test_reuse_released_handle(self):
+        db = self.pool.acquire()
+        self.pool.release(db)
+        self.assertIs(self.pool.acquire(), db)
+
+
+    def test_pool_size(self):
+        handles = [self.pool.acquire() for i in range(3)]
+        self.assertEqual(len(set(map(id, handles))), 3)
+        for db in handles:
+            self.pool.release(db)
+        # Only 'size' handles are kept, the others are closed
+        self.assertIsNone(handles[2].conn)
+        self.assertIsNotNone(handles[0].conn)
+
+
+    def test_pragmas(self):
+        db = self.pool.acquire()
+        self.assertEqual(db.select_sql('PRAGMA journal_mode', unique=True)['journal_mode'], 'wal')
+        self.assertEqual(db.select_sql('PRAGMA cache_size', unique=True)['cache_size'], -4000)
+
+
+    def test_release_rolls_back(self):
+        db = self.pool.acquire()
+        db.create_tables()
+        db.conn.execute('BEGIN')
+        db.conn.execute("INSERT INTO slide (name) VALUES ('Pending')")
+        self.pool.release(db)
+        self.assertFalse(db.conn.in_transaction)
+        self.assertEqual(db.select('slide'), [])
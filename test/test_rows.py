@@ -0,0 +1,44 @@
+import unittest
+from beacons_server import rows
+from beacons_server.db import DB
+
+
+class RowsTest(unittest.TestCase):
+
+    def test_fields(self):
+        db = DB(':memory:', create_tables=True, silent=True)
+        for table in DB.OBJ_TYPES:
+            columns = tuple(row['name'] for row in db.select_sql('PRAGMA table_info(%s)' % table))
+            self.assertEqual(rows.FIELDS[table], columns)
+        db.close()
+
+
+    def test_item(self):
+        box = rows.ITEM_CLASSES['box'](3, 2, 0, 'Box')
+        self.assertFalse(hasattr(box, '__dict__'))
+        self.assertEqual(box.id, 3)
+        self.assertEqual(box['name'], 'Box')
+        self.assertEqual(box.get('content', []), [])
+        self.assertNotIn('content', box)
+        self.assertEqual(box.to_dict(), {'id': 3, 'parent_id': 2, 'position': 0, 'name': 'Box'})
+
+        box['content'] = []
+        self.assertIn('content', box)
+        self.assertEqual(box.keys(), ['id', 'parent_id', 'position', 'name', 'content'])
+        self.assertEqual(box.to_dict()['content'], [])
+
+        with self.assertRaises(KeyError):
+            box['unknown']
+        with self.assertRaises(KeyError):
+            box['unknown'] = 1
+
+
+    def test_item_factory(self):
+        db = DB(':memory:', create_tables=True, silent=True)
+        db.insert_object('bookmark', {'name': 'Bm', 'url': 'u', 'parent_id': 4})
+
+        bookmarks = db.select_items('bookmark')
+        self.assertIsInstance(bookmarks[0], rows.ITEM_CLASSES['bookmark'])
+        self.assertEqual(bookmarks[0].to_dict(), db.select('bookmark', unique=True))
+        self.assertEqual(db.select_items('bookmark', 'WHERE parent_id = ?', (5,)), [])
+        db.close()
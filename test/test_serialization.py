@@ -0,0 +1,70 @@
+import json
+import unittest
+from flask import Flask
+from flask_restful import Api
+from beacons_server import rows, serialization
+
+
+class SerializationTest(unittest.TestCase):
+
+    data = [
+        {'id': 1, 'name': 'Slide', 'content': [{'id': 2, 'name': 'Rôw', 'css': None, 'position': 0}]},
+        {'id': 3, 'name': 'Other', 'content': []},
+    ]
+
+    def test_backends(self):
+        for name, backend in serialization.BACKENDS.items():
+            with self.subTest(backend=name):
+                compact = backend.dumps(self.data)
+                if isinstance(compact, bytes):
+                    compact = compact.decode()
+                self.assertNotIn(' ', compact.replace('Other', ''))
+                self.assertEqual(json.loads(compact), self.data)
+                self.assertEqual(json.loads(backend.dumps(self.data, pretty=True)), self.data)
+
+                # Items are serialized along with their content, if loaded
+                slide = rows.ITEM_CLASSES['slide'](1, 0, 'Slide')
+                self.assertEqual(json.loads(backend.dumps(slide)), {'id': 1, 'position': 0, 'name': 'Slide'})
+                slide.content = [rows.ITEM_CLASSES['row'](2, 1, 0, 'Row', None)]
+                self.assertEqual(json.loads(backend.dumps([slide])), [{
+                    'id': 1, 'position': 0, 'name': 'Slide',
+                    'content': [{'id': 2, 'parent_id': 1, 'position': 0, 'name': 'Row', 'css': None}],
+                }])
+                self.assertRaises(TypeError, backend.dumps, object())
+
+                # Errors of batch requests are indexed by the items' positions
+                self.assertEqual(json.loads(backend.dumps({0: 'error'})), {'0': 'error'})
+
+
+    def test_iterdumps(self):
+        for name, backend in serialization.BACKENDS.items():
+            for data in [self.data, [], {'a': 1}]:
+                with self.subTest(backend=name, data=data):
+                    streamed = b''.join(serialization.buffered(backend.iterdumps(data), size=8))
+                    self.assertEqual(json.loads(streamed), data)
+
+
+    def test_buffered(self):
+        chunks = list(serialization.buffered(['ab', b'c', 'de', b'f'], size=3))
+        self.assertEqual(chunks, [b'abc', b'def'])
+        self.assertEqual(list(serialization.buffered([])), [])
+
+
+    def test_output_json(self):
+        app = Flask(__name__)
+        serialization.init_app(app, Api(app))
+
+        with app.test_request_context():
+            response = serialization.output_json(self.data, 200, {'ETag': '"1"'})
+            self.assertFalse(response.is_streamed)
+            self.assertEqual(response.headers['ETag'], '"1"')
+            self.assertEqual(json.loads(response.get_data()), self.data)
+
+            response = serialization.output_json(serialization.Stream(self.data), 200)
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(json.loads(response.get_data()), self.data)
+
+        app.config['JSON_BACKEND'] = 'unknown'
+        self.assertRaises(ValueError, serialization.init_app, app, Api(app))
+
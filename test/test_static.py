@@ -0,0 +1,104 @@
+import gzip
+import mimetypes
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from beacons_server import static
+
+
+class StaticTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, 'js'))
+        self.write('index.html', b'<html>' + b' ' * 2000 + b'</html>')
+        self.write('js/app.56a0c436.js', b'var a = 1;' * 200)
+        self.write('favicon.png', b'\x89PNG' * 500)
+
+        app = Flask(__name__, static_folder=None)
+        static.init_app(app, self.folder)
+        self.client = app.test_client()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+    def write(self, name, content):
+        with open(os.path.join(self.folder, name), 'wb') as file:
+            file.write(content)
+
+
+    def test_cache_control(self):
+        response = self.client.get('/js/app.56a0c436.js')
+        self.assertEqual(response.data, b'var a = 1;' * 200)
+        self.assertEqual(response.mimetype, mimetypes.guess_type('app.js')[0])
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, static.IMMUTABLE_MAX_AGE)
+
+        response = self.client.get('/favicon.png')
+        self.assertFalse(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 3600)
+
+        response = self.client.get('/favicon.png', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get('/missing.js').status_code, 404)
+        self.assertEqual(self.client.get('/../test_static.py').status_code, 404)
+
+
+    def test_precompressed(self):
+        self.assertEqual(static.compress_folder(self.folder), 2 if static.brotli is None else 4)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'favicon.png.gz')))
+
+        response = self.client.get('/js/app.56a0c436.js', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, mimetypes.guess_type('app.js')[0])
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(gzip.decompress(response.data), b'var a = 1;' * 200)
+
+        response = self.client.get('/js/app.56a0c436.js', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'var a = 1;' * 200)
+
+        # Removed variants are not served anymore
+        for extension in ['.gz', '.br']:
+            if os.path.exists(os.path.join(self.folder, 'js/app.56a0c436.js' + extension)):
+                os.remove(os.path.join(self.folder, 'js/app.56a0c436.js' + extension))
+        response = self.client.get('/js/app.56a0c436.js', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        # Nor are variants older than their file
+        static.compress_folder(self.folder)
+        os.utime(os.path.join(self.folder, 'js/app.56a0c436.js'), ns=(0, 2 ** 62))
+        response = self.client.get('/js/app.56a0c436.js', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+    def test_index(self):
+        response = self.client.get('/')
+        self.assertEqual(response.mimetype, 'text/html')
+        self.assertTrue(response.data.startswith(b'<html>'))
+        self.assertTrue(response.cache_control.no_cache)
+
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(gzip.decompress(response.data).startswith(b'<html>'))
+
+        # Served from memory while the file is not modified
+        etag = response.headers['ETag']
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A new build is picked up by the next request
+        self.write('index.html', b'<html><script src="js/app.0123abcd.js"></script></html>')
+        os.utime(os.path.join(self.folder, 'index.html'), ns=(0, 2 ** 62))
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'app.0123abcd.js', gzip.decompress(response.data))
+
+        os.remove(os.path.join(self.folder, 'index.html'))
+        self.assertEqual(self.client.get('/').status_code, 404)